@@ -0,0 +1,386 @@
+# offline benchmarks for the OSPF switch apps
+# usage: python OSPF_bench.py <name> [--switches N] [--flows N] ...
+import argparse
+import random
+import struct
+import time
+import tracemalloc
+import zlib
+
+import networkx as nx
+
+import OSPF_hosts
+import OSPF_packet
+import OSPF_spf
+
+
+def make_fabric(switches, hosts, seed=0):
+    rnd = random.Random(seed)
+    graph = nx.random_regular_graph(4, switches, seed=seed)
+    net = nx.DiGraph()
+    for u, v in graph.edges():
+        net.add_edge(u + 1, v + 1, port=v + 1)
+        net.add_edge(v + 1, u + 1, port=u + 1)
+    for h in range(hosts):
+        mac = '00:00:00:%02x:%02x:%02x' % (h >> 16, (h >> 8) & 0xff, h & 0xff)
+        dpid = rnd.randint(1, switches)
+        net.add_edge(dpid, mac, port=1000 + h)
+        net.add_edge(mac, dpid)
+    return net
+
+
+def make_leaf_spine(leaves, spines, hosts_per_leaf):
+    net = nx.DiGraph()
+    for leaf in range(1, leaves + 1):
+        for spine in range(leaves + 1, leaves + spines + 1):
+            net.add_edge(leaf, spine, port=spine)
+            net.add_edge(spine, leaf, port=leaf)
+        for h in range(hosts_per_leaf):
+            mac = '00:00:00:00:%02x:%02x' % (leaf, h)
+            net.add_edge(leaf, mac, port=1000 + h)
+            net.add_edge(mac, leaf)
+    return net
+
+
+def make_pods(pods, size, seed=0):
+    # `pods` random 4-regular pods of `size` switches, each pod an area,
+    # joined by four inter-pod links per pod
+    rnd = random.Random(seed)
+    net = nx.DiGraph()
+    areas = {}
+    for pod in range(pods):
+        graph = nx.random_regular_graph(4, size, seed=seed + pod)
+        base = pod * size + 1
+        for u, v in graph.edges():
+            net.add_edge(base + u, base + v, port=v + 1)
+            net.add_edge(base + v, base + u, port=u + 1)
+        for n in range(size):
+            areas[base + n] = pod
+    for pod in range(pods):
+        for _ in range(4):
+            other = rnd.choice([p for p in range(pods) if p != pod])
+            u = pod * size + 1 + rnd.randrange(size)
+            v = other * size + 1 + rnd.randrange(size)
+            net.add_edge(u, v, port=1000 + v)
+            net.add_edge(v, u, port=1000 + u)
+    return net, areas
+
+
+def make_flows(net, flows, seed=0):
+    rnd = random.Random(seed)
+    hosts = [node for node in net if isinstance(node, str)]
+    result = []
+    for _ in range(flows):
+        src, dst = rnd.sample(hosts, 2)
+        result.append((next(iter(net[src])), src, dst))
+    return result
+
+
+def bench_route_cache(args):
+    net = make_fabric(args.switches, args.hosts or 400)
+    flows = make_flows(net, args.flows)
+
+    start = time.perf_counter()
+    for dpid, src, dst in flows:
+        path = nx.shortest_path(net, src, dst)
+        next = path[path.index(dpid) + 1]
+        net[dpid][next]['port']
+    before = time.perf_counter() - start
+
+    routes = OSPF_spf.route_cache(net)
+    start = time.perf_counter()
+    for dpid, src, dst in flows:
+        next = routes.lookup(dpid, dst)
+        net[dpid][next]['port']
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for dpid, src, dst in flows:
+        next = routes.lookup(dpid, dst)
+        net[dpid][next]['port']
+    warm = time.perf_counter() - start
+
+    print('route_cache: %d switches %d hosts %d packet-ins'
+          % (args.switches, args.hosts or 400, args.flows))
+    print('  shortest_path  %10.2f us/packet-in' % (before / args.flows * 1e6))
+    print('  route_cache    %10.2f us/packet-in cold, %.2f warm '
+          '(%d hits, %d misses)'
+          % (cold / args.flows * 1e6, warm / args.flows * 1e6,
+             routes.hits, routes.misses))
+
+
+def bench_spf_flap(args):
+    rnd = random.Random(1)
+    print('spf_flap: %d link flaps per size' % args.flaps)
+    for switches in (args.switches // 4, args.switches // 2, args.switches):
+        net = make_fabric(switches, 0)
+        routes = OSPF_spf.route_cache(net)
+        routes.rebuild()
+        links = [(u, v) for u, v in net.edges() if u < v]
+
+        start = time.perf_counter()
+        for _ in range(args.flaps):
+            u, v = rnd.choice(links)
+            port = net[u][v]['port']
+            routes.remove_link(u, v)
+            routes.add_link(u, v, port=port)
+        incremental = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(args.flaps):
+            routes.rebuild()
+        full = time.perf_counter() - start
+
+        print('  %5d switches %6d links  incremental %9.2f ms/flap  '
+              'full %9.2f ms/flap' % (switches, net.number_of_edges(),
+                                      incremental / args.flaps * 1e3,
+                                      full / args.flaps * 1e3))
+
+
+def bench_ecmp(args):
+    # hash every flow onto one bucket per hop, as a SELECT group does
+    leaves = max(2, args.switches // 5)
+    spines = max(2, args.switches - leaves)
+    net = make_leaf_spine(leaves, spines, 8)
+    flows = make_flows(net, args.flows)
+    routes = OSPF_spf.route_cache(net)
+    uplinks = [(leaf, spine) for leaf in range(1, leaves + 1)
+               for spine in range(leaves + 1, leaves + spines + 1)]
+
+    print('ecmp: %d leaves %d spines %d flows'
+          % (leaves, spines, args.flows))
+    for name, ecmp in (('single path', False), ('ecmp', True)):
+        load = dict((link, 0) for link in uplinks)
+        for first, src, dst in flows:
+            node = first
+            while node != dst:
+                if ecmp:
+                    hops = routes.lookup_all(node, dst)
+                    next = hops[zlib.crc32((src + dst).encode()) % len(hops)]
+                else:
+                    next = routes.lookup(node, dst)
+                if (node, next) in load:
+                    load[(node, next)] += 1
+                node = next
+        loads = list(load.values())
+        mean = float(sum(loads)) / len(loads)
+        fairness = sum(loads) ** 2 / float(len(loads) * sum(
+            x * x for x in loads) or 1)
+        print('  %-12s max/mean uplink load %6.2f  jain fairness %.3f  '
+              'idle uplinks %d' % (name, max(loads) / (mean or 1), fairness,
+                                   loads.count(0)))
+
+
+def bench_areas(args):
+    # all-pairs routes and link flaps, one flat SPF against per-area SPF
+    # with a summarised backbone
+    pods = max(2, args.switches // 50)
+    net, areas = make_pods(pods, args.switches // pods)
+    rnd = random.Random(1)
+    intra = [(u, v) for u, v in net.edges()
+             if u < v and areas[u] == areas[v]]
+    flaps = [rnd.choice(intra) for _ in range(args.flaps)]
+    pairs = [(u, v) for u in net for v in net if u != v]
+
+    print('areas: %d switches in %d areas, %d routes'
+          % (net.number_of_nodes(), pods, len(pairs)))
+    for name, make in (
+            ('flat', lambda: OSPF_spf.route_cache(net.copy())),
+            ('areas', lambda: OSPF_spf.area_routes(net.copy(), areas))):
+        def fill():
+            routes = make()
+            for u, v in pairs:
+                routes.lookup(u, v)
+            return routes
+        start = time.perf_counter()
+        routes, used = _measure(fill)
+        cold = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for u, v in flaps:
+            port = routes.net[u][v]['port']
+            routes.remove_link(u, v)
+            routes.add_link(u, v, port=port)
+            for dst in rnd.sample(list(routes.net), 20):
+                routes.lookup(u, dst)
+        flap = time.perf_counter() - start
+        print('  %-6s %8.1f MB  %7.2f s all routes  %8.2f ms/flap  '
+              '%d cached routes' % (name, used / 2.0 ** 20, cold,
+                                    flap / len(flaps) * 1e3,
+                                    sum(1 for _ in routes.entries())))
+
+
+def bench_lfa(args):
+    # share of (switch, destination) routes with a loop-free alternate
+    print('lfa: backup next hops per switch pair')
+    fabrics = (('random mesh', make_fabric(args.switches, 0)),
+               ('leaf-spine', make_leaf_spine(max(2, args.switches // 5),
+                                              4, 0)))
+    for name, net in fabrics:
+        routes = OSPF_spf.route_cache(net)
+        routes.rebuild()
+        pairs = [(u, v) for u in net for v in net if u != v]
+        start = time.perf_counter()
+        protected = sum(1 for u, v in pairs
+                        if routes.lfa(u, v) is not None)
+        elapsed = time.perf_counter() - start
+        print('  %-12s %5d switches  %5.1f%% protected  %6.2f us/route'
+              % (name, net.number_of_nodes(),
+                 100.0 * protected / len(pairs),
+                 elapsed / len(pairs) * 1e6))
+
+
+def _measure(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, used
+
+
+def bench_host_table(args):
+    hosts = args.hosts or 1000000
+    sample = min(hosts, 100000)
+    macs = [OSPF_hosts.int_to_mac(0x020000000000 + h) for h in range(hosts)]
+    switches = args.switches
+
+    def old_tables():
+        # per-dpid mac_to_port plus a host node and two edges in the graph
+        mac_to_port = {}
+        net = nx.DiGraph()
+        net.add_nodes_from(range(1, switches + 1))
+        for h in range(sample):
+            dpid = h % switches + 1
+            mac_to_port.setdefault(dpid, {})[macs[h]] = h % 48 + 1
+            net.add_edge(dpid, macs[h], port=h % 48 + 1)
+            net.add_edge(macs[h], dpid)
+        return mac_to_port, net
+
+    def new_table():
+        table = OSPF_hosts.host_table()
+        for h in range(hosts):
+            table.learn(macs[h], h % switches + 1, h % 48 + 1, 0.0)
+        return table
+
+    _, old = _measure(old_tables)
+    table, new = _measure(new_table)
+    start = time.perf_counter()
+    for mac in macs[:sample]:
+        table.get(mac)
+    lookup = time.perf_counter() - start
+
+    print('host_table: %d hosts over %d switches' % (hosts, switches))
+    print('  mac_to_port + graph  %8.1f bytes/host  (~%.0f MB, measured on '
+          '%d)' % (float(old) / sample, old * hosts / sample / 2.0 ** 20,
+                   sample))
+    print('  host_table           %8.1f bytes/host  (%.0f MB)  '
+          '%.2f us/lookup' % (float(new) / hosts, new / 2.0 ** 20,
+                               lookup / sample * 1e6))
+
+
+def make_frames(count, seed=0):
+    # ethernet + ipv4 + tcp headers with a small payload
+    rnd = random.Random(seed)
+    frames = []
+    for _ in range(count):
+        macs = bytes(bytearray(rnd.getrandbits(8) for _ in range(12)))
+        ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 60, 0, 0, 64, 6, 0,
+                         struct.pack('!I', rnd.getrandbits(32)),
+                         struct.pack('!I', rnd.getrandbits(32)))
+        tcp = struct.pack('!HHIIBBHHH', rnd.randint(1024, 65535), 80, 0, 0,
+                          0x50, 0x02, 8192, 0, 0)
+        frames.append(macs + struct.pack('!H', 0x0800) + ip + tcp +
+                      b'\x00' * 20)
+    return frames
+
+
+def bench_packet_parse(args):
+    frames = make_frames(args.flows)
+
+    start = time.perf_counter()
+    for data in frames:
+        dst, src, ethertype = OSPF_packet.eth_header(data)
+    fast = time.perf_counter() - start
+
+    print('packet_parse: %d frames' % len(frames))
+    try:
+        from ryu.lib.packet import ethernet
+        from ryu.lib.packet import packet
+    except ImportError:
+        print('  packet.Packet      (ryu not importable, skipped)')
+    else:
+        start = time.perf_counter()
+        for data in frames:
+            eth = packet.Packet(data).get_protocols(ethernet.ethernet)[0]
+            dst, src = eth.dst, eth.src
+        full = time.perf_counter() - start
+        print('  packet.Packet  %12.0f packet-ins/s' % (len(frames) / full))
+    print('  eth_header     %12.0f packet-ins/s' % (len(frames) / fast))
+
+
+def bench_mac_table(args):
+    # FlowMods, bytes and time for REST MAC entries on one switch, sent
+    # by REST_switch.set_mac_entries to a recording datapath: the whole
+    # table in one request, then one entry per request. The pair of
+    # in_port/eth_dst flows per known host it used to send is only counted
+    try:
+        from ryu.app import OSPF_harness
+        from ryu.app import REST_switch
+    except ImportError as e:
+        print('mac_table: needs ryu on the path (%s)' % e)
+        return
+    from ryu.controller import ofp_event
+    from ryu.ofproto import ofproto_v1_3
+    hosts = args.hosts or 10000
+    entries = [(OSPF_hosts.int_to_mac(0x020000000000 + h), h + 1)
+               for h in range(hosts)]
+
+    def program(batch):
+        app = REST_switch.REST_switch(wsgi=OSPF_harness.fake_wsgi())
+        datapath = OSPF_harness.fake_datapath(1)
+        msg = datapath.ofproto_parser.OFPSwitchFeatures(datapath,
+                                                         datapath_id=1)
+        app.switch_features_handler(ofp_event.EventOFPSwitchFeatures(msg))
+        flow_mods = datapath.sent[ofproto_v1_3.OFPT_FLOW_MOD]
+        sent = datapath.bytes
+        start = time.perf_counter()
+        for i in range(0, len(entries), batch):
+            app.set_mac_entries(1, entries[i:i + batch])
+        return (datapath.sent[ofproto_v1_3.OFPT_FLOW_MOD] - flow_mods,
+                datapath.bytes - sent, time.perf_counter() - start)
+
+    print('mac_table: %d hosts on one switch' % hosts)
+    for name, batch in (('one request', hosts), ('entry per request', 1)):
+        flow_mods, sent, elapsed = program(batch)
+        print('  %-18s %10d flow-mods  %9.3f s  %7.1f MB'
+              % (name, flow_mods, elapsed, sent / 1e6))
+    print('  %-18s %10d flow-mods  (computed, not sent)'
+          % ('full mesh', hosts * (hosts - 1)))
+
+
+BENCHMARKS = {
+    'areas': bench_areas,
+    'host_table': bench_host_table,
+    'lfa': bench_lfa,
+    'mac_table': bench_mac_table,
+    'packet_parse': bench_packet_parse,
+    'ecmp': bench_ecmp,
+    'route_cache': bench_route_cache,
+    'spf_flap': bench_spf_flap,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('name', choices=sorted(BENCHMARKS))
+    parser.add_argument('--switches', type=int, default=200)
+    parser.add_argument('--hosts', type=int)
+    parser.add_argument('--flows', type=int, default=20000)
+    parser.add_argument('--flaps', type=int, default=20)
+    args = parser.parse_args()
+    BENCHMARKS[args.name](args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+import time
+
+
+class shadow_entry(object):
+    __slots__ = ('instructions', 'hard_timeout', 'installed')
+
+    def __init__(self, instructions, hard_timeout, installed):
+        self.instructions = instructions
+        self.hard_timeout = hard_timeout
+        self.installed = installed
+
+    def expired(self, now):
+        return bool(self.hard_timeout) and \
+            now - self.installed >= self.hard_timeout
+
+
+def flow_key(table_id, priority, match):
+    return (table_id, priority, tuple(sorted(match.items())))
+
+
+def action_key(action):
+    # the fields of the output and group actions the apps send; ryu's
+    # reflective __str__ is far too slow for every FlowMod and is only the
+    # fallback for other actions
+    if hasattr(action, 'port'):
+        return (action.type, action.port, action.max_len)
+    if hasattr(action, 'group_id'):
+        return (action.type, action.group_id)
+    return (action.type, str(action))
+
+
+def instructions_key(instructions):
+    # instruction lengths are only filled in on (de)serialisation, so
+    # compare instruction types and their actions
+    key = []
+    for inst in instructions:
+        actions = getattr(inst, 'actions', None)
+        if actions is None:
+            key.append((inst.type, str(inst)))
+        else:
+            key.append((inst.type, tuple(action_key(action)
+                                         for action in actions)))
+    return tuple(key)
+
+
+class group_table(object):
+    # group key -> group id on one datapath; ids of deleted groups are
+    # handed out again once released
+
+    def __init__(self):
+        self.ids = {}
+        self.free = []
+        self.next = 1
+
+    def get(self, key):
+        return self.ids.get(key)
+
+    def add(self, key, group_id=None):
+        if group_id is None:
+            group_id = self.free.pop() if self.free else self.next
+        self.next = max(self.next, group_id + 1)
+        self.ids[key] = group_id
+        return group_id
+
+    def remove(self, key):
+        return self.ids.pop(key)
+
+    def release(self, group_ids):
+        self.free.extend(group_ids)
+
+
+class flow_queue(object):
+    MAX_BATCH = 512
+
+    def __init__(self):
+        self.datapaths = {}
+        self.pending = {}
+        self.installed = {}
+        self.callbacks = {}
+        self.unacked = {}
+        self.sent = {}
+        self.flow_mods = {}
+        self.suppressed = {}
+        self.removed = {}
+        self.rejected = {}
+
+    def reset(self, datapath):
+        dpid = datapath.id
+        self.datapaths[dpid] = datapath
+        self.installed[dpid] = {}
+        self._drop(dpid)
+
+    def forget(self, dpid):
+        self.datapaths.pop(dpid, None)
+        self.installed.pop(dpid, None)
+        self._drop(dpid)
+
+    def _drop(self, dpid):
+        self.pending.pop(dpid, None)
+        self.sent.pop(dpid, None)
+        for table in (self.callbacks, self.unacked):
+            for key in [key for key in table if key[0] == dpid]:
+                del table[key]
+
+    def send(self, datapath, msg):
+        self.datapaths[datapath.id] = datapath
+        pending = self.pending.setdefault(datapath.id, [])
+        pending.append(msg)
+        if len(pending) >= self.MAX_BATCH:
+            self.flush(datapath)
+
+    def add_flow(self, datapath, mod, now=None):
+        # skip a FlowMod that would rewrite a live entry with the same
+        # instructions; anything other than an add forgets the entry.
+        # Idle expiry is learnt from FlowRemoved, so mods should carry
+        # OFPFF_SEND_FLOW_REM
+        dpid = datapath.id
+        installed = self.installed.setdefault(dpid, {})
+        key = flow_key(mod.table_id, mod.priority, mod.match)
+        if mod.command == datapath.ofproto.OFPFC_ADD:
+            now = time.time() if now is None else now
+            value = instructions_key(mod.instructions)
+            entry = installed.get(key)
+            if entry is not None and entry.instructions == value and \
+                    not entry.expired(now):
+                self.suppressed[dpid] = self.suppressed.get(dpid, 0) + 1
+                return False
+            installed[key] = shadow_entry(value, mod.hard_timeout, now)
+            # remembered by xid until the next barrier is answered, so an
+            # error from the switch can take the entry back out
+            if mod.xid is None:
+                datapath.set_xid(mod)
+            self.sent.setdefault(dpid, {})[mod.xid] = key
+        else:
+            installed.pop(key, None)
+        self.flow_mods[dpid] = self.flow_mods.get(dpid, 0) + 1
+        self.send(datapath, mod)
+        return True
+
+    def unchanged(self, datapath, priority, fields, actions, table_id=0,
+                  now=None):
+        # add_flow's suppression check for an apply-actions entry given as
+        # plain match fields, so a caller can skip building the FlowMod
+        dpid = datapath.id
+        key = flow_key(table_id, priority, fields)
+        entry = self.installed.get(dpid, {}).get(key)
+        if entry is None:
+            return False
+        value = ((datapath.ofproto.OFPIT_APPLY_ACTIONS,
+                  tuple(action_key(action) for action in actions)),)
+        now = time.time() if now is None else now
+        if entry.instructions != value or entry.expired(now):
+            return False
+        self.suppressed[dpid] = self.suppressed.get(dpid, 0) + 1
+        return True
+
+    def adopt(self, datapath, stat, now=None):
+        # record an entry found in the switch's flow table
+        now = time.time() if now is None else now
+        installed = self.installed.setdefault(datapath.id, {})
+        key = flow_key(stat.table_id, stat.priority, stat.match)
+        installed[key] = shadow_entry(instructions_key(stat.instructions),
+                                      stat.hard_timeout,
+                                      now - stat.duration_sec)
+
+    def forget_matching(self, field, values):
+        # drop the installed entries matching field on one of values and
+        # return {dpid: values found there}, for the caller to delete
+        found = {}
+        for dpid, installed in self.installed.items():
+            for key in list(installed):
+                for name, value in key[2]:
+                    if name == field and value in values:
+                        del installed[key]
+                        found.setdefault(dpid, set()).add(value)
+                        break
+        return found
+
+    def groups_in_use(self, dpid, group_action):
+        # ids of the groups the dpid's installed entries forward to
+        used = set()
+        for entry in self.installed.get(dpid, {}).values():
+            for _, actions in entry.instructions:
+                if isinstance(actions, tuple):
+                    used.update(action[1] for action in actions
+                                if action[0] == group_action)
+        return used
+
+    def flow_removed(self, msg):
+        dpid = msg.datapath.id
+        key = flow_key(msg.table_id, msg.priority, msg.match)
+        if self.installed.get(dpid, {}).pop(key, None) is not None:
+            self.removed[dpid] = self.removed.get(dpid, 0) + 1
+
+    def flush(self, datapath=None, callback=None):
+        if datapath is None:
+            for dpid in list(self.pending):
+                self.flush(self.datapaths[dpid], callback)
+            return
+        msgs = self.pending.pop(datapath.id, [])
+        if not msgs and callback is None:
+            return
+        barrier = datapath.ofproto_parser.OFPBarrierRequest(datapath)
+        msgs.append(barrier)
+        bufs = []
+        for msg in msgs:
+            if msg.xid is None:
+                datapath.set_xid(msg)
+            msg.serialize()
+            bufs.append(msg.buf)
+        datapath.send(b''.join(bufs))
+        sent = self.sent.pop(datapath.id, None)
+        if sent:
+            self.unacked[(datapath.id, barrier.xid)] = sent
+        if callback is not None:
+            self.callbacks[(datapath.id, barrier.xid)] = callback
+
+    def barrier_reply(self, msg):
+        # errors for everything before the barrier would have come first
+        self.unacked.pop((msg.datapath.id, msg.xid), None)
+        callback = self.callbacks.pop((msg.datapath.id, msg.xid), None)
+        if callback is not None:
+            callback(msg.datapath)
+
+    def error(self, msg):
+        # forget the entry of a FlowMod the switch rejected, so it is sent
+        # again next time; returns its key, or None for other errors
+        dpid = msg.datapath.id
+        batches = [self.sent.get(dpid, {})]
+        batches.extend(sent for key, sent in self.unacked.items()
+                       if key[0] == dpid)
+        for sent in batches:
+            key = sent.pop(msg.xid, None)
+            if key is not None:
+                self.installed.get(dpid, {}).pop(key, None)
+                self.rejected[dpid] = self.rejected.get(dpid, 0) + 1
+                return key
+        return None
@@ -0,0 +1,178 @@
+import collections
+import itertools
+import time
+import zlib
+
+
+class token_bucket(object):
+    __slots__ = ('rate', 'burst', 'tokens', 'stamp')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+
+    def take(self, now):
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class packet_in_guard(object):
+    # admission control for packet-ins: drop a frame already seen on the
+    # same switch within dup_window, then charge a per-port and a
+    # per-datapath token bucket
+
+    def __init__(self, dp_rate, port_rate, dup_window):
+        self.dp_rate = dp_rate
+        self.port_rate = port_rate
+        self.dup_window = dup_window
+        self.dp_buckets = {}
+        self.port_buckets = {}
+        self.recent = {}
+        self.expiry = collections.deque()
+        self.dropped = {'duplicate': 0, 'port': 0, 'datapath': 0}
+
+    def _take(self, buckets, key, rate, now):
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = token_bucket(rate, 2 * rate, now)
+        return bucket.take(now)
+
+    def admit(self, dpid, port, data, now=None):
+        now = time.time() if now is None else now
+        expiry = self.expiry
+        while expiry and expiry[0][0] <= now:
+            key = expiry.popleft()[1]
+            if key in self.recent and self.recent[key] <= now:
+                del self.recent[key]
+
+        key = (dpid, zlib.crc32(data))
+        if key in self.recent:
+            self.dropped['duplicate'] += 1
+            return False
+        self.recent[key] = now + self.dup_window
+        expiry.append((now + self.dup_window, key))
+
+        if not self._take(self.port_buckets, (dpid, port),
+                          self.port_rate, now):
+            self.dropped['port'] += 1
+            return False
+        if not self._take(self.dp_buckets, dpid, self.dp_rate, now):
+            self.dropped['datapath'] += 1
+            return False
+        return True
+
+    def forget(self, dpid):
+        self.dp_buckets.pop(dpid, None)
+        for key in [key for key in self.port_buckets if key[0] == dpid]:
+            del self.port_buckets[key]
+
+
+class flood_tree(object):
+    # spanning forest over the switch links, patched link by link: a new
+    # link joins the tree only when it connects two components, and a lost
+    # tree link is replaced from the links of the smaller side it leaves.
+    # Mutators return the switches whose tree links changed
+
+    def __init__(self):
+        self.links = {}
+        self.directed = set()
+        self.tree = {}
+        self.component = {}
+        self.members = {}
+        self._ids = itertools.count()
+
+    def add_node(self, n):
+        if n not in self.component:
+            cid = next(self._ids)
+            self.component[n] = cid
+            self.members[cid] = set([n])
+            self.links[n] = set()
+            self.tree[n] = set()
+
+    def add_link(self, u, v):
+        self.add_node(u)
+        self.add_node(v)
+        self.directed.add((u, v))
+        self.links[u].add(v)
+        self.links[v].add(u)
+        if self.component[u] == self.component[v]:
+            return set()
+        self._join(u, v)
+        return set([u, v])
+
+    def _join(self, u, v):
+        self.tree[u].add(v)
+        self.tree[v].add(u)
+        small, large = self.component[u], self.component[v]
+        if len(self.members[small]) > len(self.members[large]):
+            small, large = large, small
+        moved = self.members.pop(small)
+        for n in moved:
+            self.component[n] = large
+        self.members[large].update(moved)
+
+    def remove_link(self, u, v):
+        # a link stays up while either direction of it is known
+        self.directed.discard((u, v))
+        if (v, u) in self.directed or v not in self.links.get(u, ()):
+            return set()
+        return self._unlink(u, v)
+
+    def _unlink(self, u, v):
+        self.links[u].discard(v)
+        self.links[v].discard(u)
+        if v not in self.tree[u]:
+            return set()
+        self.tree[u].discard(v)
+        self.tree[v].discard(u)
+        side = self._smaller_side(u, v)
+        for x in side:
+            for y in self.links[x]:
+                if y not in side:
+                    self.tree[x].add(y)
+                    self.tree[y].add(x)
+                    return set([u, v, x, y])
+        cid = next(self._ids)
+        self.members[self.component[u]] -= side
+        self.members[cid] = side
+        for n in side:
+            self.component[n] = cid
+        return set([u, v])
+
+    def _smaller_side(self, u, v):
+        # walk the two halves of the cut tree in step; the first to run
+        # out of nodes is the smaller one
+        sides = ((set([u]), [u]), (set([v]), [v]))
+        while True:
+            for seen, frontier in sides:
+                if not frontier:
+                    return seen
+                x = frontier.pop()
+                for y in self.tree[x]:
+                    if y not in seen:
+                        seen.add(y)
+                        frontier.append(y)
+
+    def remove_node(self, n):
+        if n not in self.component:
+            return set()
+        changed = set()
+        for v in list(self.links[n]):
+            self.directed.discard((n, v))
+            self.directed.discard((v, n))
+            changed |= self._unlink(n, v)
+        cid = self.component.pop(n)
+        self.members[cid].discard(n)
+        if not self.members[cid]:
+            del self.members[cid]
+        del self.links[n]
+        del self.tree[n]
+        changed.discard(n)
+        return changed
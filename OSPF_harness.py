@@ -0,0 +1,485 @@
+# offline harness for the switch apps: fake datapaths record what the app
+# sends while it is fed topology events and packet-ins over a generated
+# fabric, or a recorded packet-in trace
+# usage: python OSPF_harness.py <app> [--topology leaf-spine] [--size N] ...
+import argparse
+import collections
+import random
+import struct
+import time
+import tracemalloc
+from types import SimpleNamespace as record
+
+from webob import Request
+
+from ryu.app.wsgi import WSGIApplication
+from ryu.controller import ofp_event
+from ryu.lib import hub
+from ryu.ofproto import ofproto_v1_3
+from ryu.ofproto import ofproto_v1_3_parser
+
+_OFP_HEADER = struct.Struct('!BBHI')
+_MULTIPART = struct.Struct('!H')
+HOST_PORT_BASE = 1000
+BROADCAST = b'\xff' * 6
+
+
+class fake_datapath(object):
+    # stands in for ryu.controller.controller.Datapath: messages are
+    # serialised as they would be on the wire and counted by type; the
+    # barriers among them are queued on `barriers` for answer_barriers and
+    # multipart requests on `requests` for answer_requests
+
+    def __init__(self, dpid, barriers=None):
+        self.id = dpid
+        self.ofproto = ofproto_v1_3
+        self.ofproto_parser = ofproto_v1_3_parser
+        self.xid = 0
+        self.sent = collections.Counter()
+        self.bytes = 0
+        self.barriers = [] if barriers is None else barriers
+        self.requests = []
+
+    def set_xid(self, msg):
+        self.xid += 1
+        msg.set_xid(self.xid)
+        return self.xid
+
+    def send_msg(self, msg):
+        if msg.xid is None:
+            self.set_xid(msg)
+        msg.serialize()
+        self.send(msg.buf)
+
+    def send(self, buf):
+        self.bytes += len(buf)
+        offset = 0
+        while offset < len(buf):
+            _, msg_type, length, xid = _OFP_HEADER.unpack_from(buf, offset)
+            self.sent[msg_type] += 1
+            if msg_type == ofproto_v1_3.OFPT_BARRIER_REQUEST:
+                self.barriers.append((self, xid))
+            elif msg_type == ofproto_v1_3.OFPT_MULTIPART_REQUEST:
+                mp_type, = _MULTIPART.unpack_from(
+                    buf, offset + _OFP_HEADER.size)
+                self.requests.append((xid, mp_type))
+            offset += length
+
+
+class fake_wsgi(object):
+    def register(self, controller, data=None):
+        pass
+
+
+def fat_tree(k):
+    # k-ary fat tree: (k/2)^2 core, k pods of k/2 aggregation and k/2 edge
+    # switches; returns links [(u, u_port, v, v_port)] and edge switches
+    half = k // 2
+    core = list(range(1, half * half + 1))
+    links = []
+    edges = []
+    dpid = len(core)
+    for pod in range(k):
+        aggs = list(range(dpid + 1, dpid + half + 1))
+        tors = list(range(dpid + half + 1, dpid + k + 1))
+        dpid += k
+        for i, agg in enumerate(aggs):
+            for j in range(half):
+                links.append((agg, half + j + 1, core[i * half + j], pod + 1))
+            for j, tor in enumerate(tors):
+                links.append((tor, i + 1, agg, j + 1))
+        edges.extend(tors)
+    return links, edges
+
+
+def leaf_spine(leaves, spines):
+    links = [(leaf, spine + 1, leaves + spine + 1, leaf)
+             for leaf in range(1, leaves + 1) for spine in range(spines)]
+    return links, list(range(1, leaves + 1))
+
+
+def random_mesh(switches, degree=4, seed=0):
+    # each switch links to `degree` random others; port n on switch u
+    # leads to its n-th neighbour
+    rnd = random.Random(seed)
+    pairs = set()
+    for u in range(1, switches + 1):
+        for v in rnd.sample(range(1, switches + 1), degree + 1):
+            if v != u:
+                pairs.add((min(u, v), max(u, v)))
+    ports = collections.Counter()
+    links = []
+    for u, v in sorted(pairs):
+        ports[u] += 1
+        ports[v] += 1
+        links.append((u, ports[u], v, ports[v]))
+    return links, list(range(1, switches + 1))
+
+
+def make_topology(args):
+    if args.topology == 'fat-tree':
+        return fat_tree(args.size)
+    if args.topology == 'leaf-spine':
+        return leaf_spine(args.size, max(2, args.size // 4))
+    return random_mesh(args.size)
+
+
+def host_frame(src, dst, ethertype=0x0800):
+    return dst + src + struct.pack('!H', ethertype) + b'\x00' * 46
+
+
+def make_trace(edges, hosts_per_edge, flows, seed=0):
+    # (dpid, in_port, frame): one broadcast from every host so it is
+    # learnt, then unicast first packets between random host pairs
+    rnd = random.Random(seed)
+    hosts = []
+    for dpid in edges:
+        for port in range(hosts_per_edge):
+            mac = (0x020000000000 + len(hosts)).to_bytes(6, 'big')
+            hosts.append((dpid, HOST_PORT_BASE + port, mac))
+    trace = [(dpid, port, host_frame(mac, BROADCAST))
+             for dpid, port, mac in hosts]
+    learned = len(trace)
+    for _ in range(flows):
+        (dpid, port, src), (_, _, dst) = rnd.sample(hosts, 2)
+        trace.append((dpid, port, host_frame(src, dst)))
+    return trace, learned
+
+
+def save_trace(path, trace):
+    with open(path, 'w') as f:
+        for dpid, port, frame in trace:
+            f.write('%d %d %s\n' % (dpid, port, frame.hex()))
+
+
+def load_trace(path):
+    trace = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                dpid, port, frame = line.split()
+                trace.append((int(dpid), int(port), bytes.fromhex(frame)))
+    return trace
+
+
+def app_class(name, guard):
+    if name in ('ospf_switch', 's_monitor', 'REST_metrics'):
+        from ryu.app import OSPF_monitor
+        from ryu.app import OSPF_switch_v2
+        from ryu.app import REST_metrics
+        # there is no topology app to ask; links arrive as link events
+        OSPF_switch_v2.get_link = lambda app, dpid=None: []
+        cls = OSPF_switch_v2.ospf_switch
+        if name == 's_monitor':
+            cls = OSPF_monitor.s_monitor
+        elif name == 'REST_metrics':
+            cls = REST_metrics.REST_metrics
+    else:
+        from ryu.app import REST_switch
+        cls = REST_switch.REST_switch
+    if guard:
+        return cls
+    # a replay runs far faster than the packet-in rate limits allow
+    return type('harness_' + name, (cls,), {
+        'PACKET_IN_RATE': 1e12, 'PORT_PACKET_IN_RATE': 1e12,
+        'DUPLICATE_WINDOW': 0})
+
+
+def connect(app, datapaths, links, edges, hosts_per_edge):
+    parser = ofproto_v1_3_parser
+    for dp in datapaths.values():
+        msg = parser.OFPSwitchFeatures(dp, datapath_id=dp.id)
+        app.switch_features_handler(ofp_event.EventOFPSwitchFeatures(msg))
+    answer_requests(app, datapaths)
+    if not hasattr(app, 'link_add_handler'):
+        return
+    ports = collections.defaultdict(set)
+    for u, pu, v, pv in links:
+        ports[u].add(pu)
+        ports[v].add(pv)
+    for dpid in edges:
+        ports[dpid].update(range(HOST_PORT_BASE,
+                                 HOST_PORT_BASE + hosts_per_edge))
+    for dpid, dp in datapaths.items():
+        switch = record(dp=dp, ports=[record(port_no=port)
+                                      for port in sorted(ports[dpid])])
+        app.get_topology_data(record(switch=switch))
+    for u, pu, v, pv in links:
+        for src, dst in ((record(dpid=u, port_no=pu),
+                          record(dpid=v, port_no=pv)),
+                         (record(dpid=v, port_no=pv),
+                          record(dpid=u, port_no=pu))):
+            app.link_add_handler(record(link=record(src=src, dst=dst)))
+
+
+def answer_barriers(app, barriers):
+    # reply to every barrier sent so far, as the switches would
+    parser = ofproto_v1_3_parser
+    while barriers:
+        dp, xid = barriers.pop(0)
+        reply = parser.OFPBarrierReply(dp)
+        reply.xid = xid
+        app._barrier_reply_handler(ofp_event.EventOFPBarrierReply(reply))
+
+
+def answer_requests(app, datapaths, loads=None, start=None, matches=None):
+    # reply to the multipart requests sent so far, by xid: switches have
+    # no groups, port counters grow at loads[dpid][port] of LINK_SPEED
+    # since start, and every entry the app installed is reported back
+    # (its OFPMatch kept in matches). Returns the replies handled and the
+    # seconds spent in the handlers
+    parser = ofproto_v1_3_parser
+    ofp = ofproto_v1_3
+    now = time.time()
+    handled = 0
+    elapsed = 0.0
+    for dp in datapaths.values():
+        requests, dp.requests = dp.requests, []
+        for xid, mp_type in requests:
+            if mp_type == ofp.OFPMP_GROUP_DESC and \
+                    hasattr(app, '_group_desc_handler'):
+                reply = parser.OFPGroupDescStatsReply(dp)
+                reply.body = []
+                handler = app._group_desc_handler
+                ev = ofp_event.EventOFPGroupDescStatsReply
+            elif mp_type == ofp.OFPMP_PORT_STATS and loads is not None:
+                reply = parser.OFPPortStatsReply(dp)
+                reply.body = []
+                for port, load in sorted(loads.get(dp.id, {}).items()):
+                    tx = int(load * app.LINK_SPEED / 8 * (now - start))
+                    reply.body.append(parser.OFPPortStats(
+                        port, tx // 1000, tx // 1000, tx, tx, 0, 0, 0, 0,
+                        0, 0, 0, 0, int(now - start), 0))
+                handler = app._port_stats_reply_handler
+                ev = ofp_event.EventOFPPortStatsReply
+            elif mp_type == ofp.OFPMP_FLOW and loads is not None:
+                reply = parser.OFPFlowStatsReply(dp)
+                reply.body = []
+                packets = int((now - start) * 100)
+                for key in app.flows.installed.get(dp.id, {}):
+                    table_id, priority, match = key
+                    if (dp.id, key) not in matches:
+                        matches[(dp.id, key)] = parser.OFPMatch(**dict(match))
+                    reply.body.append(parser.OFPFlowStats(
+                        table_id, int(now - start), 0, priority, 0, 0, 0, 0,
+                        packets, packets * 100, matches[(dp.id, key)], []))
+                handler = app._flow_stats_reply_handler
+                ev = ofp_event.EventOFPFlowStatsReply
+            else:
+                continue
+            reply.xid = xid
+            reply.flags = 0
+            begin = time.perf_counter()
+            handler(ev(reply))
+            elapsed += time.perf_counter() - begin
+            handled += 1
+    return handled, elapsed
+
+
+def poll_stats(app, datapaths, links, rounds, barriers, seed=0):
+    # run s_monitor's poll scheduler on the wall clock with its intervals
+    # cut to milliseconds, every link port carrying a fixed random load;
+    # returns the replies handled, the seconds spent handling them and
+    # the FlowMods sent moving entries onto the re-costed routes
+    rnd = random.Random(seed)
+    loads = collections.defaultdict(dict)
+    for u, pu, v, pv in links:
+        loads[u][pu] = rnd.uniform(0, 0.9)
+        loads[v][pv] = rnd.uniform(0, 0.9)
+    # the harness drives _poll itself, from a fresh schedule
+    hub.kill(app.monitor_thread)
+    app.STATS_INTERVAL = 0.02
+    app.STATS_MIN_INTERVAL = 0.01
+    app.STATS_MAX_INTERVAL = 0.1
+    app.STATS_TIMEOUT = 0.05
+    for dpid in datapaths:
+        app.forget_polling(dpid)
+    app.REPROGRAM_DELAY = 0
+    before = sent(datapaths, ofproto_v1_3.OFPT_FLOW_MOD)
+    start = time.time()
+    handled = 0
+    elapsed = 0.0
+    matches = {}
+    while time.time() < start + rounds * app.STATS_INTERVAL:
+        app._poll(time.time())
+        n, seconds = answer_requests(app, datapaths, loads, start, matches)
+        handled += n
+        elapsed += seconds
+        hub.sleep(0.002)
+        answer_barriers(app, barriers)
+    if getattr(app, 'reprogram_thread', None) is not None:
+        hub.joinall([app.reprogram_thread])
+    answer_barriers(app, barriers)
+    return (handled, elapsed,
+            sent(datapaths, ofproto_v1_3.OFPT_FLOW_MOD) - before)
+
+
+def rest_requests(app, wsgi, datapaths, entries=1000, page=100):
+    # [(request, status, seconds, bytes)] through the app's WSGI routes
+    def call(name, req):
+        start = time.perf_counter()
+        res = req.get_response(wsgi)
+        results.append((name, res.status_int, time.perf_counter() - start,
+                        len(res.body)))
+        return res
+    results = []
+    if hasattr(app, 'metrics_text'):
+        call('GET /metrics', Request.blank('/metrics'))
+    if not hasattr(app, 'set_mac_entries'):
+        return results
+    dpid = min(datapaths)
+    url = '/v1/simpleswitch/mactable/%016x' % dpid
+    body = ', '.join('{"mac": "02:00:00:%02x:%02x:%02x", "port": %d}'
+                     % (i >> 16, (i >> 8) & 0xff, i & 0xff, i + 1)
+                     for i in range(entries))
+    call('PUT %d entries' % entries,
+         Request.blank(url, method='PUT', body=('[' + body + ']').encode()))
+    res = call('GET table', Request.blank(url))
+    call('GET table, same etag',
+         Request.blank(url, headers={'If-None-Match': res.etag}))
+    call('GET page of %d' % page,
+         Request.blank(url + '?offset=%d&limit=%d' % (entries // 2, page)))
+    return results
+
+
+def replay(app, datapaths, trace, barriers):
+    parser = ofproto_v1_3_parser
+    events = []
+    for dpid, port, frame in trace:
+        msg = parser.OFPPacketIn(datapaths[dpid],
+                                 buffer_id=ofproto_v1_3.OFP_NO_BUFFER,
+                                 total_len=len(frame),
+                                 reason=ofproto_v1_3.OFPR_NO_MATCH,
+                                 table_id=0, cookie=0,
+                                 match=parser.OFPMatch(in_port=port),
+                                 data=frame)
+        msg.msg_len = len(frame)
+        events.append(ofp_event.EventOFPPacketIn(msg))
+    start = time.perf_counter()
+    for ev in events:
+        app._packet_in_handler(ev)
+        answer_barriers(app, barriers)
+    return time.perf_counter() - start
+
+
+def sent(datapaths, msg_type):
+    return sum(dp.sent[msg_type] for dp in datapaths.values())
+
+
+def link_event(app, handler, u, pu, v, pv, barriers):
+    # both directions of a link, then the reprogramming that follows
+    for src, dst in ((record(dpid=u, port_no=pu),
+                      record(dpid=v, port_no=pv)),
+                     (record(dpid=v, port_no=pv),
+                      record(dpid=u, port_no=pu))):
+        handler(record(link=record(src=src, dst=dst)))
+    if getattr(app, 'reprogram_thread', None) is not None:
+        hub.joinall([app.reprogram_thread])
+    answer_barriers(app, barriers)
+
+
+def fail_links(app, links, failures, barriers, seed=0):
+    # seconds spent handling each failed link, up to the switches
+    # confirming the reprogrammed entries; the link is then brought back
+    rnd = random.Random(seed)
+    app.REPROGRAM_DELAY = 0
+    times = []
+    for u, pu, v, pv in rnd.sample(links, min(failures, len(links))):
+        start = time.perf_counter()
+        link_event(app, app.link_delete_handler, u, pu, v, pv, barriers)
+        times.append(time.perf_counter() - start)
+        link_event(app, app.link_add_handler, u, pu, v, pv, barriers)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('app', choices=('ospf_switch', 's_monitor',
+                                        'REST_metrics', 'REST_switch'))
+    parser.add_argument('--topology', default='leaf-spine',
+                        choices=('fat-tree', 'leaf-spine', 'mesh'))
+    parser.add_argument('--size', type=int, default=16,
+                        help='fat-tree k, leaf count or mesh switches')
+    parser.add_argument('--hosts', type=int, default=4,
+                        help='hosts per edge switch')
+    parser.add_argument('--flows', type=int, default=10000)
+    parser.add_argument('--failures', type=int, default=10)
+    parser.add_argument('--polls', type=int, default=20,
+                        help='stats polling intervals to run (s_monitor)')
+    parser.add_argument('--trace', help='replay packet-ins from this file')
+    parser.add_argument('--record', help='save the packet-in trace here')
+    parser.add_argument('--guard', action='store_true',
+                        help='keep the packet-in rate limits')
+    args = parser.parse_args()
+
+    links, edges = make_topology(args)
+    dpids = set(edges)
+    for u, _, v, _ in links:
+        dpids.update((u, v))
+    if args.trace:
+        trace, learned = load_trace(args.trace), 0
+    else:
+        trace, learned = make_trace(edges, args.hosts, args.flows)
+    if args.record:
+        save_trace(args.record, trace)
+
+    tracemalloc.start()
+    barriers = []
+    datapaths = dict((dpid, fake_datapath(dpid, barriers))
+                     for dpid in dpids)
+    wsgi = WSGIApplication()
+    app = app_class(args.app, args.guard)(wsgi=wsgi)
+    start = time.perf_counter()
+    connect(app, datapaths, links, edges, args.hosts)
+    answer_barriers(app, barriers)
+    setup = time.perf_counter() - start
+
+    ofp = ofproto_v1_3
+    learn_time = replay(app, datapaths, trace[:learned], barriers)
+    before = sent(datapaths, ofp.OFPT_FLOW_MOD)
+    flow_time = replay(app, datapaths, trace[learned:], barriers)
+    flow_mods = sent(datapaths, ofp.OFPT_FLOW_MOD) - before
+    failures = []
+    if hasattr(app, 'link_delete_handler'):
+        failures = fail_links(app, links, args.failures, barriers)
+    polled = None
+    if hasattr(app, '_poll'):
+        polled = poll_stats(app, datapaths, links, args.polls, barriers)
+    requests = rest_requests(app, wsgi, datapaths)
+    memory, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    flows = len(trace) - learned
+    print('%s on %s: %d switches %d links %d packet-ins'
+          % (args.app, args.topology, len(dpids), len(links), len(trace)))
+    print('  topology setup      %10.3f s' % setup)
+    if learned:
+        print('  host learning       %10.0f packet-ins/s'
+              % (learned / (learn_time or 1e-9)))
+    print('  new flows           %10.0f packet-ins/s  %.2f flow-mods/flow'
+          % (flows / (flow_time or 1e-9), float(flow_mods) / (flows or 1)))
+    if failures:
+        print('  link failure        %10.3f ms mean  %.3f ms max'
+              % (sum(failures) / len(failures) * 1e3, max(failures) * 1e3))
+    if polled is not None:
+        costs = sum(1 for _, _, data in app.net.edges(data=True)
+                    if data.get('cost', 1) != 1)
+        print('  stats replies       %10d handled  %.3f ms mean  '
+              '%d links re-costed  %d flow-mods'
+              % (polled[0], polled[1] / (polled[0] or 1) * 1e3, costs,
+                 polled[2]))
+    for name, status, seconds, size in requests:
+        print('  %-22s %7d  %.3f ms  %d bytes'
+              % (name, status, seconds * 1e3, size))
+    print('  sent                %10d flow-mods  %d packet-outs  '
+          '%d group-mods  %.1f MB'
+          % (sent(datapaths, ofp.OFPT_FLOW_MOD),
+             sent(datapaths, ofp.OFPT_PACKET_OUT),
+             sent(datapaths, ofp.OFPT_GROUP_MOD),
+             sum(dp.bytes for dp in datapaths.values()) / 2.0 ** 20))
+    print('  memory              %10.1f MB  (peak %.1f MB)'
+          % (memory / 2.0 ** 20, peak / 2.0 ** 20))
+
+
+if __name__ == '__main__':
+    main()
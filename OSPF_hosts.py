@@ -0,0 +1,107 @@
+import array
+import time
+
+
+def mac_to_int(mac):
+    return int(mac.replace(':', ''), 16)
+
+
+def int_to_mac(value):
+    return ':'.join('%02x' % ((value >> shift) & 0xff)
+                    for shift in range(40, -8, -8))
+
+
+class host_table(object):
+    # MAC (as a 48-bit int) -> slot; each slot's dpid, port and last-seen
+    # time live in flat arrays, and evicted slots are reused
+
+    def __init__(self):
+        self.index = {}
+        self.dpids = array.array('Q')
+        self.ports = array.array('L')
+        self.seen = array.array('d')
+        self.free = []
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, mac):
+        return mac_to_int(mac) in self.index
+
+    def get(self, mac):
+        slot = self.index.get(mac_to_int(mac))
+        if slot is None:
+            return None
+        return self.dpids[slot], self.ports[slot]
+
+    def learn(self, mac, dpid, port, now=None):
+        return self.learn_key(mac_to_int(mac), dpid, port, now)
+
+    def learn_key(self, key, dpid, port, now=None):
+        now = time.time() if now is None else now
+        slot = self.index.get(key)
+        if slot is None:
+            if self.free:
+                slot = self.free.pop()
+                self.dpids[slot] = dpid
+                self.ports[slot] = port
+                self.seen[slot] = now
+            else:
+                slot = len(self.dpids)
+                self.dpids.append(dpid)
+                self.ports.append(port)
+                self.seen.append(now)
+            self.index[key] = slot
+            return True
+        moved = self.dpids[slot] != dpid or self.ports[slot] != port
+        self.dpids[slot] = dpid
+        self.ports[slot] = port
+        self.seen[slot] = now
+        return moved
+
+    def remove(self, mac):
+        slot = self.index.pop(mac_to_int(mac), None)
+        if slot is None:
+            return False
+        self.free.append(slot)
+        return True
+
+    def _evict(self, keys):
+        for key in keys:
+            self.free.append(self.index.pop(key))
+        return keys
+
+    def expire(self, before, keys=None):
+        # evict hosts last seen before `before`, only among `keys` if
+        # given; returns the evicted keys
+        index = self.index
+        seen = self.seen
+        if keys is None:
+            return self._evict([key for key, slot in index.items()
+                                if seen[slot] < before])
+        return self._evict([key for key in keys
+                            if key in index and seen[index[key]] < before])
+
+    def keys(self):
+        return list(self.index)
+
+    def remove_dpid(self, dpid):
+        dpids = self.dpids
+        return self._evict([key for key, slot in self.index.items()
+                            if dpids[slot] == dpid])
+
+    def items(self):
+        for key, dpid, port in self.entries():
+            yield int_to_mac(key), dpid, port
+
+    def entries(self, keys=None):
+        # only `keys` if given, skipping any evicted since
+        if keys is None:
+            for key, slot in self.index.items():
+                yield key, self.dpids[slot], self.ports[slot]
+            return
+        index = self.index
+        for key in keys:
+            slot = index.get(key)
+            if slot is not None:
+                yield key, self.dpids[slot], self.ports[slot]
@@ -0,0 +1,97 @@
+import array
+import bisect
+import functools
+import time
+
+# histogram bucket upper bounds, in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+           0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class histogram(object):
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = array.array('Q', [0]) * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+def timed(name):
+    # time a method into the '<name>' histogram of self.metrics; with
+    # metrics off (self.metrics is None) this is one extra call and check
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            metrics = self.metrics
+            if metrics is None:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                metrics.observe(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (key, value)
+                             for key, value in sorted(labels.items()))
+
+
+class registry(object):
+    # handler latency histograms and per-datapath counters, rendered in the
+    # Prometheus text format together with samples the caller supplies
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name, value):
+        hist = self.histograms.get(name)
+        if hist is None:
+            hist = self.histograms[name] = histogram()
+        hist.observe(value)
+
+    def count(self, name, dpid, n=1):
+        counts = self.counters.get(name)
+        if counts is None:
+            counts = self.counters[name] = {}
+        counts[dpid] = counts.get(dpid, 0) + n
+
+    def render(self, samples=()):
+        # samples: (metric name, type, [(labels dict, value)])
+        lines = []
+        for name, kind, values in samples:
+            lines.append('# TYPE %s %s' % (name, kind))
+            for labels, value in values:
+                lines.append('%s%s %s' % (name, _labels(labels), value))
+
+        for name in sorted(self.counters):
+            metric = 'ospf_%s_total' % name
+            lines.append('# TYPE %s counter' % metric)
+            for dpid, value in sorted(self.counters[name].items()):
+                lines.append('%s{dpid="%016x"} %d' % (metric, dpid, value))
+
+        if self.histograms:
+            lines.append('# TYPE ospf_handler_seconds histogram')
+        for name in sorted(self.histograms):
+            hist = self.histograms[name]
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), hist.counts):
+                cumulative += count
+                lines.append('ospf_handler_seconds_bucket{handler="%s",'
+                             'le="%s"} %d' % (name, bound, cumulative))
+            lines.append('ospf_handler_seconds_sum{handler="%s"} %.9f'
+                         % (name, hist.total))
+            lines.append('ospf_handler_seconds_count{handler="%s"} %d'
+                         % (name, hist.count))
+        return '\n'.join(lines) + '\n'
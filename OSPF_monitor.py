@@ -1,16 +1,40 @@
+import random
+import time
 from operator import attrgetter
-from ryu.app import OSPF_switch
+from ryu.app import OSPF_flows
+from ryu.app import OSPF_stats
+from ryu.app import OSPF_switch_v2
 from ryu.controller import ofp_event
 from ryu.controller.handler import MAIN_DISPATCHER, DEAD_DISPATCHER
 from ryu.controller.handler import set_ev_cls
 from ryu.lib import hub
 
 
-class s_monitor(OSPF_switch.ospf_switch):
+class s_monitor(OSPF_switch_v2.ospf_switch):
+    LINK_SPEED = 1000000000
+    UTIL_SMOOTHING = 0.5
+    COST_HYSTERESIS = 2
+    STATS_INTERVAL = 10
+    STATS_MIN_INTERVAL = 2
+    STATS_MAX_INTERVAL = 60
+    STATS_JITTER = 0.2
+    STATS_CHANGE = 0.1
+    STATS_TIMEOUT = 5
+    STATS_TICK = 0.5
+    STATS_TABLE = 0
+    STATS_HISTORY = 60
+    STATS_LOG = False
 
     def __init__(self, *args, **kwargs):
         super(s_monitor, self).__init__(*args, **kwargs)
-        self.datapaths = {}
+        self.stats = OSPF_stats.stats_store(self.STATS_HISTORY)
+        self.port_util = {}
+        self.poll_interval = {}
+        self.next_poll = {}
+        self.activity = {}
+        self.outstanding = {}
+        self.timeouts = {}
+        self.next_prune = 0
         self.monitor_thread = hub.spawn(self._monitor)
 
     @set_ev_cls(ofp_event.EventOFPStateChange, [MAIN_DISPATCHER,
@@ -25,44 +49,151 @@ class s_monitor(OSPF_switch.ospf_switch):
             if datapath.id in self.datapaths:
                 self.logger.debug('unregister datapath: %016x', datapath.id)
                 del self.datapaths[datapath.id]
+            self.stats.forget(datapath.id)
+            self.forget_polling(datapath.id)
+
+    def forget_polling(self, dpid):
+        self.poll_interval.pop(dpid, None)
+        self.next_poll.pop(dpid, None)
+        self.activity.pop(dpid, None)
+        self.timeouts.pop(dpid, None)
+        for kind in ('flow', 'port'):
+            self.outstanding.pop((dpid, kind), None)
 
     def _monitor(self):
         while True:
-            for dp in self.datapaths.values():
-                self._request_stats(dp)
-            hub.sleep(10)
+            self._poll(time.time())
+            hub.sleep(self.STATS_TICK)
+
+    def _poll(self, now):
+        # each switch is polled on its own jittered schedule, first at a
+        # random point of the interval so replies do not arrive in bursts
+        for dpid, dp in list(self.datapaths.items()):
+            due = self.next_poll.get(dpid)
+            if due is None:
+                self.poll_interval[dpid] = self.STATS_INTERVAL
+                self.next_poll[dpid] = \
+                    now + random.uniform(0, self.STATS_INTERVAL)
+            elif due <= now:
+                self._request_stats(dp, now)
+                self.next_poll[dpid] = now + self._jitter(
+                    self.poll_interval[dpid])
+        if now >= self.next_prune:
+            # series missing from three rounds of replies are gone
+            self.stats.prune(now - 3 * self.STATS_MAX_INTERVAL)
+            self.next_prune = now + self.STATS_INTERVAL
 
-    def _request_stats(self, datapath):
-        self.logger.debug('send stats request: %016x', datapath.id)
+    def _jitter(self, interval):
+        return interval * random.uniform(1 - self.STATS_JITTER,
+                                         1 + self.STATS_JITTER)
+
+    def _request_stats(self, datapath, now):
+        dpid = datapath.id
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
 
-        req = parser.OFPFlowStatsRequest(datapath)
-        datapath.send_msg(req)
-        req = parser.OFPPortStatsRequest(datapath, 0, ofproto.OFPP_ANY)
-        datapath.send_msg(req)
+        for kind in ('flow', 'port'):
+            sent = self.outstanding.get((dpid, kind))
+            if sent is not None:
+                if now - sent[1] < self.STATS_TIMEOUT:
+                    # still waiting on the last one
+                    continue
+                self.logger.debug('%s stats request timed out: %016x',
+                                  kind, dpid)
+                self.timeouts[dpid] = self.timeouts.get(dpid, 0) + 1
+                self._slow_down(dpid)
+            if kind == 'flow':
+                cookie = cookie_mask = 0
+                if self.FLOW_COOKIE:
+                    cookie = self.FLOW_COOKIE
+                    cookie_mask = 0xffffffffffffffff
+                req = parser.OFPFlowStatsRequest(
+                    datapath, 0, self.STATS_TABLE, ofproto.OFPP_ANY,
+                    ofproto.OFPG_ANY, cookie, cookie_mask)
+            else:
+                req = parser.OFPPortStatsRequest(datapath, 0,
+                                                 ofproto.OFPP_ANY)
+            self.logger.debug('send %s stats request: %016x', kind, dpid)
+            datapath.send_msg(req)
+            self.outstanding[(dpid, kind)] = (req.xid, now)
+
+    def _answered(self, kind, msg):
+        # True once the last part of the reply to our request is in
+        key = (msg.datapath.id, kind)
+        sent = self.outstanding.get(key)
+        if sent is None or sent[0] != msg.xid:
+            return False
+        if not msg.flags & msg.datapath.ofproto.OFPMPF_REPLY_MORE:
+            del self.outstanding[key]
+        return True
+
+    def _slow_down(self, dpid):
+        self.poll_interval[dpid] = min(self.STATS_MAX_INTERVAL,
+                                       self.poll_interval[dpid] * 2)
+
+    def _adapt_interval(self, dpid):
+        # poll twice as often while a switch's traffic is shifting, and back
+        # off gradually while it is steady
+        activity = sum(series.rate('rx_bytes') + series.rate('tx_bytes')
+                       for _, series in self.stats.query('port', dpid))
+        last = self.activity.get(dpid)
+        self.activity[dpid] = activity
+        interval = self.poll_interval.get(dpid, self.STATS_INTERVAL)
+        if last is None:
+            return
+        if abs(activity - last) > self.STATS_CHANGE * max(last, 1):
+            interval = max(self.STATS_MIN_INTERVAL, interval / 2)
+        else:
+            interval = min(self.STATS_MAX_INTERVAL, interval * 1.5)
+        self.poll_interval[dpid] = interval
 
     @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
     def _flow_stats_reply_handler(self, ev):
+        if not self._answered('flow', ev.msg):
+            return
+        dpid = ev.msg.datapath.id
+        body = ev.msg.body
+        now = time.time()
+        for stat in body:
+            key = OSPF_flows.flow_key(stat.table_id, stat.priority,
+                                      stat.match)
+            self.stats.update_flow(dpid, key, stat, now)
+        if self.STATS_LOG:
+            self._log_flow_stats(dpid, body)
+
+    @set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
+    def _port_stats_reply_handler(self, ev):
+        if not self._answered('port', ev.msg):
+            return
+        dpid = ev.msg.datapath.id
         body = ev.msg.body
+        now = time.time()
+        for stat in body:
+            self.stats.update_port(dpid, stat, now)
+        if self.STATS_LOG:
+            self._log_port_stats(dpid, body)
+        self._update_link_costs(dpid, body)
+        if (dpid, 'port') not in self.outstanding:
+            self._adapt_interval(dpid)
 
+    def _log_flow_stats(self, dpid, body):
         self.logger.info('datapath'
                          '           in-port  eth-dst'
                          '           out-port  packets bytes')
         self.logger.info('_________________'
                          '    _____ _________________'
                          '    _____   _______ ______')
-        for stat in sorted([flow for flow in body if flow.priority == 1],
+        for stat in sorted([flow for flow in body
+                            if flow.priority == self.FIRST_HOP_PRIORITY and
+                            'in_port' in flow.match],
                            key=lambda flow: (flow.match['in_port'],
                                              flow.match['eth_dst'])):
-            self.logger.info(' %016x %8x %17s %8x %8d %8d', ev.msg.datapath.id,
+            self.logger.info(' %016x %8x %17s %8x %8d %8d', dpid,
                              stat.match['in_port'], stat.match['eth_dst'],
                              stat.instructions[0].actions[0].port,
                              stat.packet_count, stat.byte_count)
 
-    @set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
-    def _port_stats_reply_handler(self, ev):
-        body = ev.msg.body
+    def _log_port_stats(self, dpid, body):
         self.logger.info('datapath         port'
                          '        rx-pkts  rx-bytes  rx-error'
                          ' tx-pkts tx-bytes  tx-error')
@@ -71,6 +202,42 @@ class s_monitor(OSPF_switch.ospf_switch):
                          '   ______  ________   ______')
         for stat in sorted(body, key=attrgetter('port_no')):
             self.logger.info('%016x %8x %8d %8d %8d %8d %8d %8d',
-                             ev.msg.datapath.id, stat.port_no, stat.rx_packets,
+                             dpid, stat.port_no, stat.rx_packets,
                              stat.rx_bytes, stat.rx_errors, stat.tx_packets,
                              stat.tx_bytes, stat.tx_errors)
+
+    def link_cost(self, util):
+        # 1 for an idle link up to 10 for a saturated one
+        return 1 + int(min(util, 0.99) * 10)
+
+    def _update_link_costs(self, dpid, body):
+        if dpid not in self.net:
+            return
+        neighbors = dict((data['port'], v) for v, data in
+                         self.net[dpid].items() if 'port' in data)
+        changed = False
+        for stat in body:
+            key = (dpid, stat.port_no)
+            series = self.stats.port(dpid, stat.port_no)
+            if series is None or series.count < 2:
+                continue
+            rate = series.rate('tx_bytes') * 8
+            util = (self.UTIL_SMOOTHING * rate / self.LINK_SPEED +
+                    (1 - self.UTIL_SMOOTHING) * self.port_util.get(key, 0))
+            self.port_util[key] = util
+
+            v = neighbors.get(stat.port_no)
+            if v is None:
+                continue
+            cost = self.link_cost(util)
+            old = self.net[dpid][v].get('cost', 1)
+            if abs(cost - old) >= self.COST_HYSTERESIS or \
+                    (cost == 1 and old != 1):
+                self.logger.info('link cost %s -> %s: %d -> %d',
+                                 dpid, v, old, cost)
+                self.routes.set_cost(dpid, v, cost)
+                changed = True
+        # installed entries are permanent by default, so they are moved
+        # onto the new routes, or traffic would never steer off a hot link
+        if changed:
+            self.schedule_reprogram()
@@ -0,0 +1,12 @@
+import struct
+
+_ETH = struct.Struct('!6s6sH')
+
+
+def eth_header(data):
+    # (dst, src, ethertype) read in place from the first 14 bytes of the
+    # frame, without building a packet.Packet; None for a runt frame
+    if len(data) < _ETH.size:
+        return None
+    dst, src, ethertype = _ETH.unpack_from(data)
+    return dst.hex(':'), src.hex(':'), ethertype
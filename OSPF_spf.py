@@ -0,0 +1,572 @@
+import heapq
+import itertools
+import time
+
+
+def forwarding_ports(routes, dpid, dst_dpid, dst_port, ecmp=False,
+                     whole_path=True):
+    # [(switch, out ports)] from dpid toward the host at dst_dpid/dst_port,
+    # breadth first; with ecmp every equal-cost next hop is followed
+    net = routes.net
+    result = []
+    seen = set([dpid])
+    queue = [dpid]
+    while queue:
+        node = queue.pop(0)
+        if node == dst_dpid:
+            result.append((node, (dst_port,)))
+            continue
+        if ecmp:
+            hops = routes.lookup_all(node, dst_dpid)
+        else:
+            next = routes.lookup(node, dst_dpid)
+            hops = () if next is None else (next,)
+        if not hops:
+            continue
+        result.append((node, tuple(sorted(net[node][v]['port']
+                                          for v in hops))))
+        if not whole_path:
+            break
+        for v in hops:
+            if v not in seen:
+                seen.add(v)
+                queue.append(v)
+    return result
+
+
+class route_cache(object):
+
+    def __init__(self, net):
+        self.net = net
+        self.next_hop = {}
+        self.dist = {}
+        self.hits = 0
+        self.misses = 0
+        self.spf_runs = 0
+        self.spf_time = 0.0
+        self.version = 0
+        self.moved = set()
+        self.relinked = set()
+        self.cleared = False
+        self._seq = itertools.count()
+
+    def lookup(self, dpid, dst):
+        try:
+            next = self.next_hop[(dpid, dst)]
+        except KeyError:
+            self.misses += 1
+            if dst in self.dist or dst not in self.net:
+                return None
+            self._compute(dst)
+            return self.next_hop.get((dpid, dst))
+        self.hits += 1
+        return next
+
+    def lookup_all(self, dpid, dst):
+        # every neighbour on an equal-cost shortest path toward dst
+        if self.lookup(dpid, dst) is None:
+            return ()
+        dist = self.dist[dst]
+        d = dist[dpid]
+        return tuple(v for v in self.net.succ[dpid]
+                     if v in dist and dist[v] + self.cost(dpid, v) == d)
+
+    def lfa(self, dpid, dst):
+        # loop-free alternate: the cheapest neighbour other than the primary
+        # next hop whose own shortest path to dst does not lead back
+        # through dpid
+        primary = self.lookup(dpid, dst)
+        if primary is None:
+            return None
+        to_dst = self.dist[dst]
+        to_src = self.distances(dpid)
+        d = to_dst[dpid]
+        best = best_v = None
+        for v in self.net.succ[dpid]:
+            if v == primary or v not in to_dst or v not in to_src:
+                continue
+            if to_dst[v] < to_src[v] + d:
+                total = self.cost(dpid, v) + to_dst[v]
+                if best is None or total < best:
+                    best, best_v = total, v
+        return best_v
+
+    def distances(self, dst):
+        # {node: distance to dst}, computed on first use
+        if dst not in self.dist:
+            if dst not in self.net:
+                return {}
+            self._compute(dst)
+        return self.dist[dst]
+
+    def cost(self, u, v):
+        return self.net[u][v].get('cost', 1)
+
+    def changes(self):
+        # (destinations whose distances moved, switches whose links
+        # changed) since the last call, or None if every route may have
+        changes = None if self.cleared else (self.moved, self.relinked)
+        self.moved, self.relinked, self.cleared = set(), set(), False
+        return changes
+
+    def _compute(self, dst):
+        dist = self.dist[dst] = {dst: 0}
+        self._spread(dst, dist, [(0, next(self._seq), dst)])
+
+    def _spread(self, dst, dist, heap, allowed=None):
+        # Dijkstra toward dst over predecessors, starting from heap
+        start = time.perf_counter()
+        pred = self.net.pred
+        next_hop = self.next_hop
+        done = set()
+        while heap:
+            d, _, v = heapq.heappop(heap)
+            if v in done or d > dist[v]:
+                continue
+            done.add(v)
+            for u in pred[v]:
+                if u == dst or (allowed is not None and u not in allowed):
+                    continue
+                nd = d + self.cost(u, v)
+                if nd < dist.get(u, float('inf')):
+                    dist[u] = nd
+                    next_hop[(u, dst)] = v
+                    heapq.heappush(heap, (nd, next(self._seq), u))
+        self.spf_runs += 1
+        self.spf_time += time.perf_counter() - start
+
+    def _subtree(self, dst, root):
+        # every node whose route to dst runs through root
+        pred = self.net.pred
+        next_hop = self.next_hop
+        nodes = {root}
+        stack = [root]
+        while stack:
+            v = stack.pop()
+            for u in pred[v]:
+                if u not in nodes and next_hop.get((u, dst)) == v:
+                    nodes.add(u)
+                    stack.append(u)
+        return nodes
+
+    def _repair(self, dst, nodes):
+        # reattach a detached subtree through its best exits, then run
+        # Dijkstra inside the subtree only
+        dist = self.dist[dst]
+        succ = self.net.succ
+        for u in nodes:
+            dist.pop(u, None)
+            self.next_hop.pop((u, dst), None)
+        heap = []
+        for u in nodes:
+            if u not in succ:
+                continue
+            best = best_v = None
+            for v in succ[u]:
+                if v in dist and v not in nodes:
+                    nd = dist[v] + self.cost(u, v)
+                    if best is None or nd < best:
+                        best, best_v = nd, v
+            if best_v is not None:
+                dist[u] = best
+                self.next_hop[(u, dst)] = best_v
+                heapq.heappush(heap, (best, next(self._seq), u))
+        self._spread(dst, dist, heap, nodes)
+
+    def add_link(self, u, v, **attr):
+        self.version += 1
+        self.relinked.add(u)
+        if self.net.has_edge(u, v):
+            cost = attr.pop('cost', self.cost(u, v))
+            self.net[u][v].update(attr)
+            self.set_cost(u, v, cost)
+            return
+        self.net.add_edge(u, v, **attr)
+        self._relax(u, v)
+
+    def _relax(self, u, v):
+        for dst, dist in self.dist.items():
+            if v not in dist or u == dst:
+                continue
+            nd = dist[v] + self.cost(u, v)
+            if nd < dist.get(u, float('inf')):
+                dist[u] = nd
+                self.next_hop[(u, dst)] = v
+                self.moved.add(dst)
+                self._spread(dst, dist, [(nd, next(self._seq), u)])
+
+    def remove_link(self, u, v):
+        if not self.net.has_edge(u, v):
+            return
+        self.version += 1
+        self.relinked.add(u)
+        affected = [(dst, self._subtree(dst, u)) for dst in self.dist
+                    if self.next_hop.get((u, dst)) == v]
+        self.net.remove_edge(u, v)
+        for dst, nodes in affected:
+            self.moved.add(dst)
+            self._repair(dst, nodes)
+
+    def set_cost(self, u, v, cost):
+        if not self.net.has_edge(u, v) or self.cost(u, v) == cost:
+            return
+        self.version += 1
+        self.relinked.add(u)
+        if cost < self.cost(u, v):
+            self.net[u][v]['cost'] = cost
+            self._relax(u, v)
+            return
+        affected = [(dst, self._subtree(dst, u)) for dst in self.dist
+                    if self.next_hop.get((u, dst)) == v]
+        self.net[u][v]['cost'] = cost
+        for dst, nodes in affected:
+            self.moved.add(dst)
+            self._repair(dst, nodes)
+
+    def remove_node(self, n):
+        if n not in self.net:
+            return
+        self.version += 1
+        self.relinked.update(self.net.pred[n])
+        self.invalidate(n)
+        affected = [(dst, self._subtree(dst, n)) for dst, dist in
+                    self.dist.items() if n in dist]
+        self.net.remove_node(n)
+        for dst, nodes in affected:
+            self.moved.add(dst)
+            self._repair(dst, nodes)
+
+    def rebuild(self):
+        self.invalidate()
+        for dst in list(self.net.nodes()):
+            self._compute(dst)
+
+    def clear(self):
+        self.version += 1
+        self.cleared = True
+        self.invalidate()
+        self.net.clear()
+
+    def entries(self):
+        # (dst, node, next hop, distance) for every cached route; safe to
+        # resume after the cache has changed, if no longer consistent
+        for dst in list(self.dist):
+            dist = self.dist.get(dst)
+            if dist is None:
+                continue
+            for node, d in list(dist.items()):
+                next = self.next_hop.get((node, dst))
+                if node != dst and next is not None:
+                    yield dst, node, next, d
+
+    def restore(self, dst, node, next, d):
+        self.dist.setdefault(dst, {dst: 0})[node] = d
+        self.next_hop[(node, dst)] = next
+
+    def invalidate(self, dst=None):
+        if dst is None:
+            self.next_hop.clear()
+            self.dist.clear()
+        elif dst in self.dist:
+            for node in self.dist.pop(dst):
+                self.next_hop.pop((node, dst), None)
+
+
+class area_routes(object):
+    # OSPF-style areas (areas maps dpid -> area, 0 by default): a
+    # route_cache per area over its intra-area links, and a backbone graph
+    # of the area border switches whose edges are the inter-area links
+    # plus, per area, a summary edge between each pair of its borders
+    # costed at their intra-area distance. A destination in the same area
+    # is reached inside it when it can be; anything else goes through the
+    # exit border that minimises the composed cost
+
+    def __init__(self, net, areas=None):
+        self.net = net
+        self.areas = areas or {}
+        self.caches = {}
+        self.backbone = net.__class__()
+        self.borders = {}
+        self.summaries = {}
+        self.stale = set()
+        self.exits = {}
+        self.version = 0
+        self.backbone_runs = 0
+        self.backbone_time = 0.0
+        self._seq = itertools.count()
+        for u, v, data in list(net.edges(data=True)):
+            self._add(u, v, data)
+            self.stale.update((self.area_of(u), self.area_of(v)))
+
+    @property
+    def hits(self):
+        return sum(cache.hits for cache in self.caches.values())
+
+    @property
+    def misses(self):
+        return sum(cache.misses for cache in self.caches.values())
+
+    @property
+    def spf_runs(self):
+        return self.backbone_runs + sum(cache.spf_runs for cache in
+                                        self.caches.values())
+
+    @property
+    def spf_time(self):
+        return self.backbone_time + sum(cache.spf_time for cache in
+                                        self.caches.values())
+
+    def area_of(self, node):
+        return self.areas.get(node, 0)
+
+    def _cache(self, area):
+        cache = self.caches.get(area)
+        if cache is None:
+            cache = self.caches[area] = route_cache(self.net.__class__())
+        return cache
+
+    def _add(self, u, v, attr):
+        area = self.area_of(u)
+        if area == self.area_of(v):
+            self._cache(area).add_link(u, v, **attr)
+        elif self.backbone.has_edge(u, v):
+            self.backbone[u][v].update(attr)
+        else:
+            self.backbone.add_edge(u, v, **attr)
+
+    def _changed(self, *areas):
+        self.version += 1
+        self.stale.update(areas)
+        self.exits.clear()
+
+    def cost(self, u, v):
+        return self.net[u][v].get('cost', 1)
+
+    def changes(self):
+        # a change in one area moves summary edges and exits elsewhere,
+        # so every route is reported as possibly changed
+        return None
+
+    def add_link(self, u, v, **attr):
+        if self.net.has_edge(u, v):
+            self.net[u][v].update(attr)
+        else:
+            self.net.add_edge(u, v, **attr)
+        self._add(u, v, attr)
+        self._changed(self.area_of(u), self.area_of(v))
+
+    def remove_link(self, u, v):
+        if not self.net.has_edge(u, v):
+            return
+        self.net.remove_edge(u, v)
+        area = self.area_of(u)
+        if area == self.area_of(v):
+            self._cache(area).remove_link(u, v)
+        else:
+            self.backbone.remove_edge(u, v)
+        self._changed(self.area_of(u), self.area_of(v))
+
+    def set_cost(self, u, v, cost):
+        if not self.net.has_edge(u, v) or self.cost(u, v) == cost:
+            return
+        self.net[u][v]['cost'] = cost
+        area = self.area_of(u)
+        if area == self.area_of(v):
+            self._cache(area).set_cost(u, v, cost)
+        else:
+            self.backbone[u][v]['cost'] = cost
+        self._changed(self.area_of(u), self.area_of(v))
+
+    def remove_node(self, n):
+        if n not in self.net:
+            return
+        areas = set(self.area_of(v) for v in
+                    itertools.chain([n], self.net.succ[n], self.net.pred[n]))
+        self.net.remove_node(n)
+        self._cache(self.area_of(n)).remove_node(n)
+        if n in self.backbone:
+            self.backbone.remove_node(n)
+        self._changed(*areas)
+
+    def _refresh(self):
+        # recompute the borders and summary edges of areas whose links
+        # changed, and patch the backbone with the difference
+        area_of = self.area_of
+        for area in self.stale:
+            cache = self._cache(area)
+            old = self.borders.get(area, set())
+            borders = set()
+            for n in self.backbone:
+                if area_of(n) == area and n in self.net and any(
+                        area_of(v) != area for v in itertools.chain(
+                            self.net.succ[n], self.net.pred[n])):
+                    borders.add(n)
+            summary = {}
+            for b in borders:
+                for b2 in borders:
+                    if b != b2 and cache.lookup(b, b2) is not None:
+                        summary[(b, b2)] = cache.dist[b2][b]
+            old_summary = self.summaries.get(area, {})
+            backbone = self.backbone
+            for u, v in old_summary:
+                if (u, v) not in summary and backbone.has_edge(u, v):
+                    backbone.remove_edge(u, v)
+            for (u, v), cost in summary.items():
+                backbone.add_edge(u, v, cost=cost)
+            self.summaries[area] = summary
+            self.borders[area] = borders
+            for n in old - borders:
+                if n in backbone and not backbone.succ[n] and \
+                        not backbone.pred[n]:
+                    backbone.remove_node(n)
+        self.stale.clear()
+
+    def _area_distance(self, area, node, dst):
+        if node == dst:
+            return 0
+        cache = self._cache(area)
+        if cache.lookup(node, dst) is None:
+            return None
+        return cache.dist[dst][node]
+
+    def _exits(self, dst):
+        # {backbone switch: (cost to dst, next backbone hop)} by Dijkstra
+        # over the backbone, seeded with the borders of dst's area at their
+        # intra-area distance. Those stay fixed, as a packet reaching one
+        # is routed inside the area from there
+        exits = self.exits.get(dst)
+        if exits is not None:
+            return exits
+        start = time.perf_counter()
+        exits = self.exits[dst] = {}
+        area = self.area_of(dst)
+        fixed = set()
+        heap = []
+        for b in self.borders.get(area, ()):
+            d = self._area_distance(area, b, dst)
+            if d is not None:
+                exits[b] = (d, None)
+                fixed.add(b)
+                heapq.heappush(heap, (d, next(self._seq), b))
+        pred = self.backbone.pred
+        done = set()
+        while heap:
+            d, _, v = heapq.heappop(heap)
+            if v in done or d > exits[v][0]:
+                continue
+            done.add(v)
+            for u in pred[v]:
+                if u in fixed:
+                    continue
+                nd = d + self.backbone[u][v].get('cost', 1)
+                if u not in exits or nd < exits[u][0]:
+                    exits[u] = (nd, v)
+                    heapq.heappush(heap, (nd, next(self._seq), u))
+        self.backbone_runs += 1
+        self.backbone_time += time.perf_counter() - start
+        return exits
+
+    def _composed(self, node, dst):
+        # (cost, exit border) from node to dst over the backbone
+        self._refresh()
+        area = self.area_of(node)
+        exits = self._exits(dst)
+        cache = self._cache(area)
+        best = None
+        for b in self.borders.get(area, ()):
+            exit = exits.get(b)
+            if exit is None:
+                continue
+            d = 0 if b == node else cache.distances(b).get(node)
+            if d is not None and (best is None or d + exit[0] < best[0]):
+                best = (d + exit[0], b)
+        return best
+
+    def distance(self, node, dst):
+        area = self.area_of(node)
+        if area == self.area_of(dst):
+            d = self._area_distance(area, node, dst)
+            if d is not None:
+                return d
+        best = self._composed(node, dst)
+        return None if best is None else best[0]
+
+    def lookup(self, dpid, dst):
+        # inter-area next hops are not cached: they come from the area's
+        # routes to its borders and the exits toward dst, so that memory
+        # grows with area size times border count rather than with the
+        # square of the fabric
+        if dpid == dst or dpid not in self.net or dst not in self.net:
+            return None
+        area = self.area_of(dpid)
+        cache = self._cache(area)
+        if area == self.area_of(dst):
+            next = cache.lookup(dpid, dst)
+            if next is not None:
+                return next
+        best = self._composed(dpid, dst)
+        if best is None:
+            return None
+        if best[1] != dpid:
+            return cache.lookup(dpid, best[1])
+        # dpid is the exit: follow the backbone, through the area when the
+        # next backbone hop is a summary edge
+        next = self._exits(dst)[dpid][1]
+        if next is None or self.area_of(next) != area:
+            return next
+        return cache.lookup(dpid, next)
+
+    def lookup_all(self, dpid, dst):
+        if self.lookup(dpid, dst) is None:
+            return ()
+        area = self.area_of(dpid)
+        if area == self.area_of(dst) and \
+                self._area_distance(area, dpid, dst) is not None:
+            return self._cache(area).lookup_all(dpid, dst)
+        d = self.distance(dpid, dst)
+        hops = []
+        for v in self.net.succ[dpid]:
+            dv = self.distance(v, dst)
+            if dv is not None and dv + self.cost(dpid, v) == d:
+                hops.append(v)
+        return tuple(hops)
+
+    def lfa(self, dpid, dst):
+        # alternates only for destinations routed inside the area, where
+        # the area's own metric is the one the routes follow
+        area = self.area_of(dpid)
+        if area != self.area_of(dst):
+            return None
+        return self._cache(area).lfa(dpid, dst)
+
+    def rebuild(self):
+        self.invalidate()
+        for cache in self.caches.values():
+            cache.rebuild()
+        self._refresh()
+
+    def clear(self):
+        self.net.clear()
+        self.caches = {}
+        self.backbone = self.net.__class__()
+        self.borders = {}
+        self.summaries = {}
+        self.stale = set()
+        self._changed()
+
+    def entries(self):
+        # intra-area routes only; the backbone is cheap to recompute
+        for cache in list(self.caches.values()):
+            for entry in cache.entries():
+                yield entry
+
+    def restore(self, dst, node, next, d):
+        self._cache(self.area_of(dst)).restore(dst, node, next, d)
+
+    def invalidate(self, dst=None):
+        self.exits.clear()
+        if dst is None:
+            for cache in self.caches.values():
+                cache.invalidate()
+        else:
+            self._cache(self.area_of(dst)).invalidate(dst)
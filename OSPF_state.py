@@ -0,0 +1,97 @@
+import itertools
+import mmap
+import os
+import struct
+import time
+
+# file layout: header, then fixed-size edge, host and route records. Link
+# costs and route distances are stored as unsigned 32-bit integers
+MAGIC = b'OSPF'
+FORMAT = 1
+_HEADER = struct.Struct('<4sHIII')
+_EDGE = struct.Struct('<QQII')
+_HOST = struct.Struct('<QQI')
+_ROUTE = struct.Struct('<QQQI')
+SLICE = 10000
+
+
+def save(path, routes, hosts, pause=None):
+    # with pause, records are packed and written SLICE at a time and pause
+    # is called in between; routes that changed meanwhile are left out,
+    # as the edges are taken at the end
+    version = routes.version
+    n_hosts, host_chunks = _pack(_HOST, hosts.entries(hosts.keys()), pause)
+    n_routes, route_chunks = _pack(_ROUTE, routes.entries(), pause)
+    if routes.version != version:
+        n_routes, route_chunks = 0, []
+    edges = []
+    for u, v, data in routes.net.edges(data=True):
+        cost = data.get('cost', 1)
+        if not isinstance(cost, int):
+            raise ValueError('link %s -> %s: cost %r is not an integer'
+                             % (u, v, cost))
+        edges.append(_EDGE.pack(u, v, data['port'], cost))
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT, len(edges), n_hosts, n_routes))
+        f.write(b''.join(edges))
+        for chunk in host_chunks + route_chunks:
+            f.write(chunk)
+            if pause is not None:
+                pause()
+    os.replace(tmp, path)
+
+
+def _pack(record, rows, pause):
+    rows = iter(rows)
+    count = 0
+    chunks = []
+    while True:
+        chunk = [record.pack(*row) for row in itertools.islice(rows, SLICE)]
+        if not chunk:
+            return count, chunks
+        count += len(chunk)
+        chunks.append(b''.join(chunk))
+        if pause is not None:
+            pause()
+
+
+def load(path, routes, hosts, now=None):
+    # fill an empty route cache (and its graph) and host table from a file
+    # written by save; returns the restored switch-to-switch edges. An
+    # empty file or another format raises ValueError, and a truncated one
+    # struct.error
+    now = time.time() if now is None else now
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        with memoryview(data) as view:
+            magic, fmt, n_edges, n_hosts, n_routes = _HEADER.unpack_from(view)
+            if magic != MAGIC or fmt != FORMAT:
+                raise ValueError('%s: not an OSPF state file' % path)
+            size = (_HEADER.size + n_edges * _EDGE.size +
+                    n_hosts * _HOST.size + n_routes * _ROUTE.size)
+            if len(view) != size:
+                raise struct.error('%s: %d bytes, the header needs %d'
+                                   % (path, len(view), size))
+            offset = _HEADER.size
+
+            end = offset + n_edges * _EDGE.size
+            edges = []
+            for u, v, port, cost in _EDGE.iter_unpack(view[offset:end]):
+                routes.add_link(u, v, port=port, cost=cost)
+                edges.append((u, v))
+            offset = end
+
+            end = offset + n_hosts * _HOST.size
+            for key, dpid, port in _HOST.iter_unpack(view[offset:end]):
+                hosts.learn_key(key, dpid, port, now)
+            offset = end
+
+            end = offset + n_routes * _ROUTE.size
+            for dst, node, next, d in _ROUTE.iter_unpack(view[offset:end]):
+                routes.restore(dst, node, next, d)
+    finally:
+        data.close()
+    return edges
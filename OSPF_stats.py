@@ -0,0 +1,125 @@
+import array
+
+PORT_FIELDS = ('rx_packets', 'rx_bytes', 'rx_errors',
+               'tx_packets', 'tx_bytes', 'tx_errors')
+FLOW_FIELDS = ('packet_count', 'byte_count')
+
+
+class counter_series(object):
+    # the last `size` samples of a set of counters, one ring-buffered array
+    # per counter; rates against the previous sample are kept on append
+    __slots__ = ('fields', 'size', 'times', 'values', 'rates', 'head',
+                 'count')
+
+    def __init__(self, fields, size):
+        self.fields = fields
+        self.size = size
+        self.times = array.array('d', [0.0]) * size
+        self.values = [array.array('Q', [0]) * size for _ in fields]
+        self.rates = array.array('d', [0.0]) * len(fields)
+        self.head = 0
+        self.count = 0
+
+    def append(self, now, values):
+        head = self.head
+        if self.count:
+            last = head - 1
+            dt = now - self.times[last]
+            if dt > 0:
+                for i, value in enumerate(values):
+                    # a counter going backwards means it was reset
+                    delta = value - self.values[i][last]
+                    self.rates[i] = delta / dt if delta >= 0 else 0.0
+        self.times[head] = now
+        for i, value in enumerate(values):
+            self.values[i][head] = value
+        self.head = (head + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    @property
+    def updated(self):
+        return self.times[self.head - 1] if self.count else 0.0
+
+    def latest(self):
+        if not self.count:
+            return {}
+        last = self.head - 1
+        return dict((field, self.values[i][last])
+                    for i, field in enumerate(self.fields))
+
+    def rate(self, field):
+        return self.rates[self.fields.index(field)]
+
+    def delta(self, field):
+        if self.count < 2:
+            return 0
+        values = self.values[self.fields.index(field)]
+        return values[self.head - 1] - values[self.head - 2]
+
+    def history(self, field, since=0):
+        # (time, value) pairs, oldest first
+        values = self.values[self.fields.index(field)]
+        start = self.head - self.count
+        samples = []
+        for i in range(start, self.head):
+            if self.times[i] >= since:
+                samples.append((self.times[i], values[i]))
+        return samples
+
+
+class stats_store(object):
+    # port series keyed by (dpid, port_no), flow series by (dpid, flow key)
+
+    def __init__(self, size=60):
+        self.size = size
+        self.ports = {}
+        self.flows = {}
+
+    def _update(self, series, key, fields, now, values):
+        entry = series.get(key)
+        if entry is None:
+            entry = series[key] = counter_series(fields, self.size)
+        entry.append(now, values)
+        return entry
+
+    def update_port(self, dpid, stat, now):
+        return self._update(self.ports, (dpid, stat.port_no), PORT_FIELDS,
+                            now, [getattr(stat, f) for f in PORT_FIELDS])
+
+    def update_flow(self, dpid, key, stat, now):
+        return self._update(self.flows, (dpid, key), FLOW_FIELDS,
+                            now, [stat.packet_count, stat.byte_count])
+
+    def port(self, dpid, port_no):
+        return self.ports.get((dpid, port_no))
+
+    def flow(self, dpid, key):
+        return self.flows.get((dpid, key))
+
+    def query(self, kind='port', dpid=None, field=None, top=None):
+        # [(key, series)] for one switch or all, optionally the `top`
+        # busiest by rate of `field`
+        series = self.ports if kind == 'port' else self.flows
+        found = [(key, entry) for key, entry in series.items()
+                 if dpid is None or key[0] == dpid]
+        if field is not None:
+            found.sort(key=lambda item: item[1].rate(field), reverse=True)
+        if top is not None:
+            found = found[:top]
+        return found
+
+    def prune(self, before):
+        # drop series not refreshed since `before` (removed flows and ports)
+        dropped = 0
+        for series in (self.ports, self.flows):
+            stale = [key for key, entry in series.items()
+                     if entry.updated < before]
+            for key in stale:
+                del series[key]
+            dropped += len(stale)
+        return dropped
+
+    def forget(self, dpid):
+        for series in (self.ports, self.flows):
+            for key in [key for key in series if key[0] == dpid]:
+                del series[key]
@@ -3,30 +3,45 @@ from ryu.controller import ofp_event
 from ryu.controller.handler import MAIN_DISPATCHER, CONFIG_DISPATCHER
 from ryu.controller.handler import set_ev_cls
 from ryu.ofproto import ofproto_v1_3
-from ryu.lib.packet import packet
-from ryu.lib.packet import ethernet
+from ryu.lib.packet import ether_types
 from ryu.topology import event, switches
 from ryu.topology.api import get_switch, get_link
+from ryu.app import OSPF_flows
+from ryu.app import OSPF_guard
+from ryu.app import OSPF_packet
 
 
 class ospf_switch(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+    FLOW_IDLE_TIMEOUT = 0
+    FLOW_HARD_TIMEOUT = 0
+    PACKET_IN_RATE = 1000
+    PORT_PACKET_IN_RATE = 100
+    DUPLICATE_WINDOW = 0.5
 
     def __init__(self, *args, **kwargs):
         super(ospf_switch, self).__init__(*args, **kwargs)
         self.mac_to_port = {}
+        self.mac_version = {}
+        self.flows = OSPF_flows.flow_queue()
+        self.guard = OSPF_guard.packet_in_guard(self.PACKET_IN_RATE,
+                                                self.PORT_PACKET_IN_RATE,
+                                                self.DUPLICATE_WINDOW)
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
     def switch_features_handler(self, ev):
         datapath = ev.msg.datapath
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
+        self.flows.reset(datapath)
         match = parser.OFPMatch()
         actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER,
                                           ofproto.OFPCML_NO_BUFFER)]
         self.add_flow(datapath, 0, match, actions)
+        self.flows.flush(datapath)
 
-    def add_flow(self, datapath, priority, match, actions, buffer_id=None):
+    def add_flow(self, datapath, priority, match, actions, buffer_id=None,
+                 idle_timeout=0, hard_timeout=0):
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
 
@@ -35,11 +50,42 @@ class ospf_switch(app_manager.RyuApp):
         if buffer_id:
             mod = parser.OFPFlowMod(datapath=datapath, buffer_id=buffer_id,
                                     priority=priority, match=match,
-                                    instructions=inst)
+                                    instructions=inst,
+                                    idle_timeout=idle_timeout,
+                                    hard_timeout=hard_timeout,
+                                    flags=ofproto.OFPFF_SEND_FLOW_REM)
         else:
             mod = parser.OFPFlowMod(datapath=datapath, priority=priority,
-                                    match=match, instructions=inst)
-        datapath.send_msg(mod)
+                                    match=match, instructions=inst,
+                                    idle_timeout=idle_timeout,
+                                    hard_timeout=hard_timeout,
+                                    flags=ofproto.OFPFF_SEND_FLOW_REM)
+        self.flows.add_flow(datapath, mod)
+
+    def learn_mac(self, dpid, mac, port):
+        # mac_to_port, versioned for the REST cache; True if it changed
+        mac_table = self.mac_to_port.setdefault(dpid, {})
+        if mac_table.get(mac) == port:
+            return False
+        mac_table[mac] = port
+        self.mac_version[dpid] = self.mac_version.get(dpid, 0) + 1
+        return True
+
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    def _flow_removed_handler(self, ev):
+        self.flows.flow_removed(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER)
+    def _barrier_reply_handler(self, ev):
+        self.flows.barrier_reply(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPErrorMsg, [CONFIG_DISPATCHER,
+                                             MAIN_DISPATCHER])
+    def _error_msg_handler(self, ev):
+        msg = ev.msg
+        if self.flows.error(msg) is not None:
+            self.logger.info('flow-mod rejected by %016x: type %d code %d',
+                             msg.datapath.id, msg.type, msg.code)
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def _packet_in_handler(self, ev):
@@ -51,17 +97,20 @@ class ospf_switch(app_manager.RyuApp):
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
         in_port = msg.match['in_port']
+        if not self.guard.admit(datapath.id, in_port, msg.data):
+            return
 
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocols(ethernet.ethernet)[0]
-
-        dst = eth.dst
-        src = eth.src
+        header = OSPF_packet.eth_header(msg.data)
+        if header is None:
+            return
+        dst, src, ethertype = header
+        if ethertype == ether_types.ETH_TYPE_LLDP:
+            return
 
         dpid = datapath.id
         self.mac_to_port.setdefault(dpid, {})
-        self.logger.info('packet in %s %s %s %s', dpid, src, dst, in_port)
-        self.mac_to_port[dpid][src] = in_port
+        self.logger.debug('packet in %s %s %s %s', dpid, src, dst, in_port)
+        self.learn_mac(dpid, src, in_port)
 
         if dst in self.mac_to_port[dpid]:
             out_port = self.mac_to_port[dpid][dst]
@@ -70,12 +119,13 @@ class ospf_switch(app_manager.RyuApp):
         actions = [parser.OFPActionOutput(out_port)]
         if out_port != ofproto.OFPP_FLOOD:
             match = parser.OFPMatch(in_port=in_port, eth_dst=dst)
-            if msg.buffer_id != ofproto.OFP_NO_BUFFER:
-                self.add_flow(datapath, 1, match, actions)
-                return
-            else:
-                self.add_flow(datapath, 1, match, actions)
+            self.add_flow(datapath, 1, match, actions,
+                          idle_timeout=self.FLOW_IDLE_TIMEOUT,
+                          hard_timeout=self.FLOW_HARD_TIMEOUT)
+            self.flows.flush()
 
+        # the FlowMod may be suppressed as already installed, so a
+        # buffered packet is always released with a PacketOut of its own
         data = None
         if msg.buffer_id == ofproto.OFP_NO_BUFFER:
             data = msg.data
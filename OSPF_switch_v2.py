@@ -1,43 +1,216 @@
 import logging
 import struct
+import time
 from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import MAIN_DISPATCHER, CONFIG_DISPATCHER
 from ryu.controller.handler import set_ev_cls
 from ryu.ofproto import ofproto_v1_3
-from ryu.lib.packet import packet
-from ryu.lib.packet import ethernet
+from ryu.lib.packet import ether_types
 from ryu.topology import event, switches
-from ryu.topology.api import get_switch, get_link
-from ryu.app.wsgi import ControllerBase
+from ryu.lib import hub
+from ryu.topology.api import get_link
 import networkx as nx
-from ryu.lib.mac import haddr_to_bin
+from ryu.app import OSPF_flows
+from ryu.app import OSPF_guard
+from ryu.app import OSPF_hosts
+from ryu.app import OSPF_metrics
+from ryu.app import OSPF_packet
+from ryu.app import OSPF_spf
+from ryu.app import OSPF_state
 
 
 class ospf_switch(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+    FLOW_IDLE_TIMEOUT = 0
+    FLOW_HARD_TIMEOUT = 0
+    FLOW_COOKIE = 0
+    PATH_PRIORITY = 1
+    FIRST_HOP_PRIORITY = 2
+    PACKET_IN_RATE = 1000
+    PORT_PACKET_IN_RATE = 100
+    DUPLICATE_WINDOW = 0.5
+    PROACTIVE_PATHS = True
+    ECMP = False
+    FAST_FAILOVER = True
+    REPROGRAM_DELAY = 0.05
+    HOST_AGING = 300
+    HOST_AGING_SLICE = 10000
+    STATE_FILE = None
+    STATE_SAVE_PERIOD = 30
+    RESTORE_GRACE = 60
+    AREAS = None
 
     def __init__(self, *args, **kwargs):
         super(ospf_switch, self).__init__(*args, **kwargs)
-        self.mac_to_port = {}
+        self.hosts = OSPF_hosts.host_table()
         self.topology_api_app = self
         self.net = nx.DiGraph()
+        if self.AREAS:
+            self.routes = OSPF_spf.area_routes(self.net, self.AREAS)
+        else:
+            self.routes = OSPF_spf.route_cache(self.net)
+        self.flows = OSPF_flows.flow_queue()
+        self.guard = OSPF_guard.packet_in_guard(self.PACKET_IN_RATE,
+                                                self.PORT_PACKET_IN_RATE,
+                                                self.DUPLICATE_WINDOW)
+        self.datapaths = {}
+        self.groups = {}
+        self.group_sync = set()
+        self.ports = {}
+        self.flood_tree = OSPF_guard.flood_tree()
+        self.flood_ports = {}
         self.nodes = {}
         self.links = {}
         self.no_of_nodes = 0
         self.no_of_links = 0
+        self.metrics = None
+        self.unconfirmed = set()
+        self.reconciling = set()
+        self.reprogramming = False
+        self.restored = False
+        self.aging_thread = hub.spawn(self._age_hosts)
+        if self.STATE_FILE:
+            self.restore_state()
+            self.state_thread = hub.spawn(self._save_state)
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
+    @OSPF_metrics.timed('switch_features')
     def switch_features_handler(self, ev):
         datapath = ev.msg.datapath
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
-        match = parser.OFPMatch(in_port=in_port,dl_dst=haddr_to_bin(dst))
+        self.datapaths[datapath.id] = datapath
+        self.flows.reset(datapath)
+        match = parser.OFPMatch()
         actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER,
                                           ofproto.OFPCML_NO_BUFFER)]
         self.add_flow(datapath, 0, match, actions)
+        self.groups[datapath.id] = OSPF_flows.group_table()
+        if self.ECMP or self.FAST_FAILOVER:
+            # groups left from an earlier run are read back and reused;
+            # deleting them would take the entries forwarding to them along
+            self.group_sync.add(datapath.id)
+            self.flows.send(datapath,
+                            parser.OFPGroupDescStatsRequest(datapath, 0))
+            # answered ahead of the flow dump, whose entries use them
+            self.flows.flush(datapath)
+        if self.restored:
+            # entries are only worth checking against restored state
+            self.reconciling.add(datapath.id)
+            self.flows.send(datapath, parser.OFPFlowStatsRequest(datapath))
+        self.flows.flush(datapath)
+
+    def restore_state(self):
+        try:
+            edges = OSPF_state.load(self.STATE_FILE, self.routes, self.hosts)
+        except (IOError, OSError, ValueError, struct.error) as e:
+            self.logger.info('cold start, no state in %s: %s',
+                             self.STATE_FILE, e)
+            self.routes.clear()
+            self.hosts = OSPF_hosts.host_table()
+            return
+        self.restored = True
+        self.unconfirmed = set(edges)
+        for u, v in edges:
+            self.flood_tree.add_link(u, v)
+        self.logger.info('restored %d links and %d hosts from %s',
+                         len(edges), len(self.hosts), self.STATE_FILE)
+
+    def _save_state(self):
+        # restored links that LLDP has not confirmed within RESTORE_GRACE
+        # are dropped; the state file is rewritten every STATE_SAVE_PERIOD
+        started = time.time()
+        while True:
+            hub.sleep(self.STATE_SAVE_PERIOD)
+            if self.unconfirmed and \
+                    time.time() - started >= self.RESTORE_GRACE:
+                changed = set()
+                for u, v in self.unconfirmed:
+                    self.routes.remove_link(u, v)
+                    changed |= self.flood_tree.remove_link(u, v)
+                self.unconfirmed = set()
+                self.update_flood_ports(changed)
+            try:
+                OSPF_state.save(self.STATE_FILE, self.routes, self.hosts,
+                                pause=lambda: hub.sleep(0))
+            except (IOError, OSError, ValueError) as e:
+                self.logger.info('saving %s failed: %s', self.STATE_FILE, e)
+
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    @OSPF_metrics.timed('flow_reconcile')
+    def _flow_reconcile_handler(self, ev):
+        # adopt what a (re)connected switch already has in its flow table,
+        # deleting only learnt entries that send a restored host somewhere
+        # its restored route does not
+        msg = ev.msg
+        datapath = msg.datapath
+        if datapath.id not in self.reconciling:
+            return
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        groups = dict((group_id, key) for key, group_id in
+                      self.groups[datapath.id].ids.items())
+        for stat in msg.body:
+            if stat.priority in (self.PATH_PRIORITY,
+                                 self.FIRST_HOP_PRIORITY) and \
+                    self.conflicts(datapath.id, stat, groups):
+                mod = parser.OFPFlowMod(datapath=datapath,
+                                        table_id=stat.table_id,
+                                        command=ofproto.OFPFC_DELETE_STRICT,
+                                        priority=stat.priority,
+                                        match=stat.match,
+                                        out_port=ofproto.OFPP_ANY,
+                                        out_group=ofproto.OFPG_ANY)
+                self.flows.add_flow(datapath, mod)
+            else:
+                self.flows.adopt(datapath, stat)
+        if not msg.flags & ofproto.OFPMPF_REPLY_MORE:
+            self.reconciling.discard(datapath.id)
+        self.flows.flush(datapath)
+
+    @set_ev_cls(ofp_event.EventOFPGroupDescStatsReply, MAIN_DISPATCHER)
+    def _group_desc_handler(self, ev):
+        # select groups are keyed on their ports and failover groups on
+        # their primary and backup port, as select_group and failover_group
+        # would have. Anything else, and everything on a cold start where
+        # the entries using them are not reconciled, keeps its id reserved
+        msg = ev.msg
+        datapath = msg.datapath
+        if datapath.id not in self.group_sync:
+            return
+        ofproto = datapath.ofproto
+        groups = self.groups[datapath.id]
+        for stat in msg.body:
+            ports = tuple(bucket_port(bucket) for bucket in stat.buckets)
+            key = ('foreign', stat.group_id)
+            if not self.restored or not ports or None in ports:
+                pass
+            elif stat.type == ofproto.OFPGT_SELECT:
+                key = tuple(sorted(ports))
+            elif stat.type == ofproto.OFPGT_FF and len(ports) == 2:
+                key = ('failover',) + ports
+            if groups.get(key) is not None:
+                key = ('foreign', stat.group_id)
+            groups.add(key, stat.group_id)
+        if not msg.flags & ofproto.OFPMPF_REPLY_MORE:
+            self.group_sync.discard(datapath.id)
+
+    def conflicts(self, dpid, stat, groups):
+        dst = stat.match.get('eth_dst')
+        loc = self.hosts.get(dst) if dst is not None else None
+        if loc is None:
+            return False
+        hops = OSPF_spf.forwarding_ports(self.routes, dpid, loc[0], loc[1],
+                                         self.ECMP, False)
+        ports = entry_ports(stat.instructions, groups)
+        if not hops or ports is None:
+            return False
+        return ports != set(hops[0][1])
 
-    def add_flow(self, datapath, priority, match, actions, buffer_id=None):
+    @OSPF_metrics.timed('add_flow')
+    def add_flow(self, datapath, priority, match, actions, buffer_id=None,
+                 idle_timeout=0, hard_timeout=0):
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
 
@@ -45,54 +218,310 @@ class ospf_switch(app_manager.RyuApp):
                                              actions)]
         if buffer_id:
             mod = parser.OFPFlowMod(datapath=datapath, buffer_id=buffer_id,
+                                    cookie=self.FLOW_COOKIE,
                                     priority=priority, match=match,
-                                    instructions=inst)
+                                    instructions=inst,
+                                    idle_timeout=idle_timeout,
+                                    hard_timeout=hard_timeout,
+                                    flags=ofproto.OFPFF_SEND_FLOW_REM)
         else:
             mod = parser.OFPFlowMod(datapath=datapath, priority=priority,
-                                    match=match, instructions=inst)
-        datapath.send_msg(mod)
+                                    cookie=self.FLOW_COOKIE,
+                                    match=match, instructions=inst,
+                                    idle_timeout=idle_timeout,
+                                    hard_timeout=hard_timeout,
+                                    flags=ofproto.OFPFF_SEND_FLOW_REM)
+        self.flows.add_flow(datapath, mod)
+
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    def _flow_removed_handler(self, ev):
+        self.flows.flow_removed(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER)
+    def _barrier_reply_handler(self, ev):
+        self.flows.barrier_reply(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPErrorMsg, [CONFIG_DISPATCHER,
+                                             MAIN_DISPATCHER])
+    def _error_msg_handler(self, ev):
+        msg = ev.msg
+        if self.flows.error(msg) is not None:
+            self.logger.info('flow-mod rejected by %016x: type %d code %d',
+                             msg.datapath.id, msg.type, msg.code)
+
+    def select_group(self, datapath, ports):
+        groups = self.groups[datapath.id]
+        key = tuple(sorted(ports))
+        group_id = groups.get(key)
+        if group_id is None:
+            ofproto = datapath.ofproto
+            parser = datapath.ofproto_parser
+            group_id = groups.add(key)
+            # a bucket whose port is down drops out of the selection
+            buckets = [parser.OFPBucket(1, port, ofproto.OFPG_ANY,
+                                        [parser.OFPActionOutput(port)])
+                       for port in ports]
+            req = parser.OFPGroupMod(datapath, ofproto.OFPGC_ADD,
+                                     ofproto.OFPGT_SELECT, group_id, buckets)
+            self.flows.send(datapath, req)
+        return group_id
+
+    def failover_group(self, datapath, primary, backup):
+        # the switch moves to the backup bucket as soon as the primary port
+        # goes down, without asking the controller
+        groups = self.groups[datapath.id]
+        key = ('failover', primary, backup)
+        group_id = groups.get(key)
+        if group_id is None:
+            ofproto = datapath.ofproto
+            parser = datapath.ofproto_parser
+            group_id = groups.add(key)
+            buckets = [parser.OFPBucket(0, port, ofproto.OFPG_ANY,
+                                        [parser.OFPActionOutput(port)])
+                       for port in (primary, backup)]
+            req = parser.OFPGroupMod(datapath, ofproto.OFPGC_ADD,
+                                     ofproto.OFPGT_FF, group_id, buckets)
+            self.flows.send(datapath, req)
+        return group_id
+
+    def collect_groups(self, datapath):
+        # groups no installed entry forwards to any more are deleted; their
+        # ids are handed out again once the switch has confirmed that
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        groups = self.groups.get(datapath.id)
+        if not groups or datapath.id in self.group_sync or \
+                datapath.id in self.reconciling:
+            return
+        used = self.flows.groups_in_use(datapath.id, ofproto.OFPAT_GROUP)
+        unused = [key for key, group_id in groups.ids.items()
+                  if group_id not in used and key[0] != 'foreign']
+        if not unused:
+            return
+        group_ids = []
+        for key in unused:
+            group_id = groups.remove(key)
+            self.flows.send(datapath, parser.OFPGroupMod(
+                datapath, ofproto.OFPGC_DELETE, 0, group_id))
+            group_ids.append(group_id)
+        self.flows.flush(datapath,
+                         lambda datapath: groups.release(group_ids))
+
+    def is_link_port(self, dpid, port):
+        return dpid in self.net and any(
+            data['port'] == port for data in self.net[dpid].values())
+
+    def learn_host(self, mac, dpid, port, now):
+        # first sighting anywhere, a refresh at home, or a move to another
+        # edge port; sightings on inter-switch ports are transit traffic
+        loc = self.hosts.get(mac)
+        if loc is None or loc == (dpid, port) or \
+                not self.is_link_port(dpid, port):
+            if self.hosts.learn(mac, dpid, port, now) and loc is not None:
+                self.forget_hosts([mac])
+
+    def forget_hosts(self, macs):
+        # entries toward a host that moved or was dropped would keep its
+        # traffic going to the old port for good; they are deleted, and
+        # the next packet-in for the host sets up its route again
+        found = self.flows.forget_matching('eth_dst', set(macs))
+        for dpid, dsts in found.items():
+            datapath = self.datapaths.get(dpid)
+            if datapath is None:
+                continue
+            ofproto = datapath.ofproto
+            parser = datapath.ofproto_parser
+            for dst in sorted(dsts):
+                mod = parser.OFPFlowMod(datapath=datapath,
+                                        table_id=ofproto.OFPTT_ALL,
+                                        command=ofproto.OFPFC_DELETE,
+                                        out_port=ofproto.OFPP_ANY,
+                                        out_group=ofproto.OFPG_ANY,
+                                        match=parser.OFPMatch(eth_dst=dst))
+                self.flows.add_flow(datapath, mod)
+            self.flows.flush(datapath)
+
+    def _age_hosts(self):
+        # hosts unseen for HOST_AGING are dropped a slice of the table at
+        # a time, so the scan never holds up packet-ins
+        while True:
+            hub.sleep(self.HOST_AGING)
+            before = time.time() - self.HOST_AGING
+            hosts = self.hosts
+            keys = hosts.keys()
+            expired = []
+            for i in range(0, len(keys), self.HOST_AGING_SLICE):
+                expired.extend(hosts.expire(
+                    before, keys[i:i + self.HOST_AGING_SLICE]))
+                hub.sleep(0)
+            if expired:
+                self.forget_hosts([OSPF_hosts.int_to_mac(key)
+                                   for key in expired])
+
+    def backup_hop(self, dpid, ports, dst_dpid):
+        # the loop-free alternate neighbour guarding a single next hop
+        if not self.FAST_FAILOVER or len(ports) != 1 or dpid == dst_dpid:
+            return None
+        return self.routes.lfa(dpid, dst_dpid)
+
+    def port_actions(self, datapath, ports, backup=None):
+        # a select group over equal-cost ports, a failover group onto the
+        # backup neighbour, or plain output while the switch's groups are
+        # still being read back
+        parser = datapath.ofproto_parser
+        dpid = datapath.id
+        if dpid in self.group_sync:
+            return [parser.OFPActionOutput(ports[0])]
+        if len(ports) > 1:
+            return [parser.OFPActionGroup(self.select_group(datapath, ports))]
+        if backup is not None:
+            group_id = self.failover_group(datapath, ports[0],
+                                           self.net[dpid][backup]['port'])
+            return [parser.OFPActionGroup(group_id)]
+        return [parser.OFPActionOutput(port) for port in ports]
+
+    def forwarding(self, dpid, dst):
+        loc = self.hosts.get(dst)
+        if loc is None:
+            return []
+        return OSPF_spf.forwarding_ports(self.routes, dpid, loc[0], loc[1],
+                                         self.ECMP, self.PROACTIVE_PATHS)
+
+    def update_flood_ports(self, dpids):
+        # link ports off the spanning tree are left out of floods so
+        # broadcasts cannot loop; only switches whose ports or tree links
+        # changed are recomputed
+        tree = self.flood_tree.tree
+        for dpid in dpids:
+            ports = self.ports.get(dpid)
+            if ports is None:
+                self.flood_ports.pop(dpid, None)
+                continue
+            blocked = set()
+            if dpid in self.net:
+                neighbours = tree.get(dpid, ())
+                blocked = set(data['port'] for v, data in
+                              self.net[dpid].items() if v not in neighbours)
+            self.flood_ports[dpid] = tuple(sorted(ports - blocked))
+
+    def flood_actions(self, datapath, in_port):
+        parser = datapath.ofproto_parser
+        ports = self.flood_ports.get(datapath.id)
+        if ports is None:
+            return [parser.OFPActionOutput(datapath.ofproto.OFPP_FLOOD)]
+        return [parser.OFPActionOutput(port) for port in ports
+                if port != in_port]
+
+    def install_path(self, dst, loc, hops, seen):
+        # program eth_dst on the switches in hops and on the path onward
+        # from every backup neighbour a failover group there can switch
+        # to, so traffic moved onto a backup finds its entry waiting.
+        # Switches already in seen are skipped and the rest are added
+        pending = []
+        for hop in hops:
+            if hop[0] not in seen:
+                seen.add(hop[0])
+                pending.append(hop)
+        while pending:
+            dpid, ports = pending.pop()
+            datapath = self.datapaths.get(dpid)
+            if datapath is None:
+                continue
+            backup = self.backup_hop(dpid, ports, loc[0])
+            actions = self.port_actions(datapath, ports, backup)
+            if not self.flows.unchanged(datapath, self.PATH_PRIORITY,
+                                        {'eth_dst': dst}, actions):
+                match = datapath.ofproto_parser.OFPMatch(eth_dst=dst)
+                self.add_flow(datapath, self.PATH_PRIORITY, match, actions,
+                              idle_timeout=self.FLOW_IDLE_TIMEOUT,
+                              hard_timeout=self.FLOW_HARD_TIMEOUT)
+            if backup is None:
+                continue
+            for hop in self.backup_path(backup, loc):
+                if hop[0] not in seen:
+                    seen.add(hop[0])
+                    pending.append(hop)
+
+    def backup_path(self, backup, loc):
+        if backup is None:
+            return []
+        return OSPF_spf.forwarding_ports(self.routes, backup, loc[0], loc[1],
+                                         self.ECMP, True)
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
+    @OSPF_metrics.timed('packet_in')
     def _packet_in_handler(self, ev):
         if ev.msg.msg_len < ev.msg.total_len:
             self.logger.debug("packet truncated: only %s of %s bytes",
                               ev.msg.msg_len, ev.msg.total_len)
         msg = ev.msg
         datapath = msg.datapath
-        ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
         in_port = msg.match['in_port']
+        if not self.guard.admit(datapath.id, in_port, msg.data):
+            return
 
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocols(ethernet.ethernet)[0]
-
-        dst = eth.dst
-        src = eth.src
+        header = OSPF_packet.eth_header(msg.data)
+        if header is None:
+            return
+        dst, src, ethertype = header
+        if ethertype == ether_types.ETH_TYPE_LLDP:
+            return
 
         dpid = datapath.id
-        self.mac_to_port.setdefault(dpid, {})
-        self.logger.info('packet in %s %s %s %s', dpid, src, dst, in_port)
-        self.mac_to_port[dpid][src] = in_port
-
-        if src not in self.net:
-            self.net.add_node(src)
-            self.net.add_edfe(dpid,src,{'port':msg.in_port})
-            self.net.add_edge(src,dpid)
-        if dst in self.net:
-            path = nx.shortest_path(self.net, src, dst)
-            next = path[path.index(dpid)+1]
-            out_port = self.net[dpid][next]['port']
-        else:
-            out_port = ofproto.OFPP_FLOOD
-        actions = [parser.OFPActionOutput(out_port)]
-        if out_port != ofproto.OFPP_FLOOD:
-            match = parser.OFPMatch(in_port=in_port, eth_dst=dst)
-            if msg.buffer_id != ofproto.OFP_NO_BUFFER:
-                self.add_flow(datapath, 1, match, actions)
-                return
-            else:
-                self.add_flow(datapath, 1, match, actions)
+        if self.metrics is not None:
+            self.metrics.count('packet_in', dpid)
+        self.logger.debug('packet in %s %s %s %s', dpid, src, dst, in_port)
+        self.learn_host(src, dpid, in_port, time.time())
+        self.forward(msg, in_port, dst, self.forwarding(dpid, dst))
+
+    def forward(self, msg, in_port, dst, hops):
+        # the first hop's in_port entry sits above the eth_dst entries so
+        # the two never overlap at one priority on a switch
+        datapath = msg.datapath
+        parser = datapath.ofproto_parser
+        if not hops or hops[0][0] != datapath.id:
+            self.packet_out(msg, in_port,
+                            self.flood_actions(datapath, in_port))
+            return
+        loc = self.hosts.get(dst)
+        if loc is None:
+            self.packet_out(msg, in_port,
+                            self.flood_actions(datapath, in_port))
+            return
+        backup = self.backup_hop(datapath.id, hops[0][1], loc[0])
+        actions = self.port_actions(datapath, hops[0][1], backup)
+        seen = set()
+        self.install_path(dst, loc,
+                          hops[1:] + self.backup_path(backup, loc), seen)
+        match = parser.OFPMatch(in_port=in_port, eth_dst=dst)
+        self.add_flow(datapath, self.FIRST_HOP_PRIORITY, match, actions,
+                      idle_timeout=self.FLOW_IDLE_TIMEOUT,
+                      hard_timeout=self.FLOW_HARD_TIMEOUT)
+        # switches answer over their own connections, so the packet waits
+        # for every one it may cross to confirm its entries
+        seen.add(datapath.id)
+        self.after_barriers(seen,
+                            lambda: self.packet_out(msg, in_port, actions))
+
+    def after_barriers(self, dpids, callback):
+        # flush the queued messages of dpids and call back once all of
+        # them have answered the barrier behind those
+        waiting = set(dpid for dpid in dpids if dpid in self.datapaths)
+        if not waiting:
+            callback()
+            return
 
+        def answered(datapath):
+            waiting.discard(datapath.id)
+            if not waiting:
+                callback()
+        for dpid in list(waiting):
+            self.flows.flush(self.datapaths[dpid], answered)
+
+    def packet_out(self, msg, in_port, actions):
+        datapath = msg.datapath
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
         data = None
         if msg.buffer_id == ofproto.OFP_NO_BUFFER:
             data = msg.data
@@ -100,15 +529,160 @@ class ospf_switch(app_manager.RyuApp):
         out = parser.OFPPacketOut(datapath=datapath, buffer_id=msg.buffer_id,
                                   in_port=in_port, actions=actions, data=data)
         datapath.send_msg(out)
+        if self.metrics is not None:
+            self.metrics.count('packet_out', datapath.id)
 
     @set_ev_cls(event.EventSwitchEnter)
+    @OSPF_metrics.timed('switch_enter')
     def get_topology_data(self, ev):
-        switch_list = get_switch(self.topology_api_app, None)
-        switches = [switch.dp.id for switch in switch_list]
-        link_list = get_link(self.topology_api_app, None)
-        self.net.add_nodes_from(switches)
-        links=[(link.src.dpid,link.dst.dpid,
-                {'port':link.src.port_no}) for link in links_list]
-        self.ned_add_edges_from(links)
-        self.logger.info('******************************** List of links')
-        self.logger.info(self.net.edges())
+        dpid = ev.switch.dp.id
+        ofproto = ev.switch.dp.ofproto
+        self.net.add_node(dpid)
+        self.ports[dpid] = set(port.port_no for port in ev.switch.ports
+                               if port.port_no <= ofproto.OFPP_MAX)
+        self.flood_tree.add_node(dpid)
+        changed = set([dpid])
+        for link in get_link(self.topology_api_app, dpid):
+            self.unconfirmed.discard((link.src.dpid, link.dst.dpid))
+            self.routes.add_link(link.src.dpid, link.dst.dpid,
+                                 port=link.src.port_no)
+            changed |= self.flood_tree.add_link(link.src.dpid,
+                                                link.dst.dpid)
+            changed.add(link.src.dpid)
+        self.update_flood_ports(changed)
+        self.logger.info('switch enter %s', dpid)
+
+    @set_ev_cls(event.EventSwitchLeave)
+    @OSPF_metrics.timed('switch_leave')
+    def switch_leave_handler(self, ev):
+        dpid = ev.switch.dp.id
+        self.datapaths.pop(dpid, None)
+        self.groups.pop(dpid, None)
+        self.flows.forget(dpid)
+        self.forget_hosts([OSPF_hosts.int_to_mac(key)
+                           for key in self.hosts.remove_dpid(dpid)])
+        self.guard.forget(dpid)
+        self.ports.pop(dpid, None)
+        self.routes.remove_node(dpid)
+        changed = self.flood_tree.remove_node(dpid)
+        changed.add(dpid)
+        self.update_flood_ports(changed)
+        self.logger.info('switch leave %s', dpid)
+
+    @set_ev_cls(event.EventLinkAdd)
+    @OSPF_metrics.timed('link_add')
+    def link_add_handler(self, ev):
+        link = ev.link
+        self.unconfirmed.discard((link.src.dpid, link.dst.dpid))
+        self.routes.add_link(link.src.dpid, link.dst.dpid,
+                             port=link.src.port_no)
+        changed = self.flood_tree.add_link(link.src.dpid, link.dst.dpid)
+        changed.add(link.src.dpid)
+        self.update_flood_ports(changed)
+        self.schedule_reprogram()
+        self.logger.info('link add %s -> %s', link.src.dpid, link.dst.dpid)
+
+    @set_ev_cls(event.EventLinkDelete)
+    @OSPF_metrics.timed('link_delete')
+    def link_delete_handler(self, ev):
+        link = ev.link
+        self.routes.remove_link(link.src.dpid, link.dst.dpid)
+        changed = self.flood_tree.remove_link(link.src.dpid, link.dst.dpid)
+        changed.add(link.src.dpid)
+        self.update_flood_ports(changed)
+        self.schedule_reprogram()
+        self.logger.info('link delete %s -> %s', link.src.dpid, link.dst.dpid)
+
+    def schedule_reprogram(self):
+        if not self.reprogramming:
+            self.reprogramming = True
+            self.reprogram_thread = hub.spawn(self._reprogram)
+
+    def _reprogram(self):
+        # failover groups carry traffic over a dead link at once; here the
+        # learnt eth_dst entries are moved onto the recomputed routes, a
+        # recovered link included, and groups left unused are deleted. The
+        # short delay lets a burst of link events settle first
+        hub.sleep(self.REPROGRAM_DELAY)
+        self.reprogramming = False
+        # an entry's route and alternate only depend on the distances
+        # toward its destination and from its switch, and on the links of
+        # its switch; entries none of those changed for are skipped
+        changes = self.routes.changes()
+        seen = {}
+        for dpid, installed in list(self.flows.installed.items()):
+            datapath = self.datapaths.get(dpid)
+            if datapath is None:
+                continue
+            parser = datapath.ofproto_parser
+            moved = changes is None or dpid in changes[0] or \
+                dpid in changes[1]
+            for table_id, priority, match in list(installed):
+                fields = dict(match)
+                if priority not in (self.PATH_PRIORITY,
+                                    self.FIRST_HOP_PRIORITY) or \
+                        'eth_dst' not in fields:
+                    continue
+                dst = fields['eth_dst']
+                loc = self.hosts.get(dst)
+                if loc is None or not (moved or loc[0] in changes[0]):
+                    continue
+                hops = OSPF_spf.forwarding_ports(self.routes, dpid, loc[0],
+                                                 loc[1], self.ECMP, False)
+                if not hops:
+                    continue
+                if priority == self.PATH_PRIORITY:
+                    self.install_path(dst, loc, hops,
+                                      seen.setdefault(dst, set()))
+                    continue
+                backup = self.backup_hop(dpid, hops[0][1], loc[0])
+                actions = self.port_actions(datapath, hops[0][1], backup)
+                if not self.flows.unchanged(datapath, priority, fields,
+                                            actions, table_id):
+                    self.add_flow(datapath, priority,
+                                  parser.OFPMatch(**fields), actions,
+                                  idle_timeout=self.FLOW_IDLE_TIMEOUT,
+                                  hard_timeout=self.FLOW_HARD_TIMEOUT)
+                self.install_path(dst, loc, self.backup_path(backup, loc),
+                                  seen.setdefault(dst, set()))
+            for datapath in list(self.datapaths.values()):
+                self.flows.flush(datapath)
+            hub.sleep(0)
+        for datapath in list(self.datapaths.values()):
+            self.collect_groups(datapath)
+
+    @set_ev_cls(event.EventPortAdd)
+    def port_add_handler(self, ev):
+        port = ev.port
+        self.ports.setdefault(port.dpid, set()).add(port.port_no)
+        self.update_flood_ports([port.dpid])
+
+    @set_ev_cls(event.EventPortDelete)
+    def port_delete_handler(self, ev):
+        port = ev.port
+        self.ports.get(port.dpid, set()).discard(port.port_no)
+        self.update_flood_ports([port.dpid])
+
+
+def entry_ports(instructions, groups):
+    # the ports an entry forwards to, a failover group counting only its
+    # primary; None if that cannot be told
+    ports = set()
+    for inst in instructions:
+        for action in getattr(inst, 'actions', ()):
+            if hasattr(action, 'port'):
+                ports.add(action.port)
+            elif hasattr(action, 'group_id'):
+                key = groups.get(action.group_id)
+                if key is None or key[0] == 'foreign':
+                    return None
+                ports.update(key[1:2] if key[0] == 'failover' else key)
+    return ports
+
+
+def bucket_port(bucket):
+    # the port of a bucket holding a single output action
+    if len(bucket.actions) != 1 or \
+            not hasattr(bucket.actions[0], 'port'):
+        return None
+    return bucket.actions[0].port
@@ -0,0 +1,202 @@
+import json
+import re
+
+from ryu.controller.network import MacAddressAlreadyExist
+from ryu.exception import NetworkNotFound, NetworkAlreadyExist
+from ryu.exception import PortNotFound, PortAlreadyExist
+
+_MAC = re.compile(r'^([0-9a-f]{2}:){5}[0-9a-f]{2}$')
+
+
+def normalize_mac(mac):
+    mac = mac.lower()
+    if not _MAC.match(mac):
+        raise ValueError('bad mac: %r' % (mac,))
+    return mac
+
+
+class tenant_registry(object):
+    # networks -> ports -> MACs, indexed by network, by dpid and by MAC;
+    # list replies are kept as encoded JSON until the part they cover
+    # changes
+
+    def __init__(self):
+        self.networks = {}
+        self.ports = {}
+        self.by_dpid = {}
+        self.macs = {}
+        self.by_mac = {}
+        self.cache = {}
+
+    def _changed(self, *keys):
+        for key in keys:
+            self.cache.pop(key, None)
+
+    def _cached(self, key, build):
+        body = self.cache.get(key)
+        if body is None:
+            body = self.cache[key] = json.dumps(build()).encode('utf-8')
+        return body
+
+    def _ports(self, network_id):
+        ports = self.networks.get(network_id)
+        if ports is None:
+            raise NetworkNotFound(network_id=network_id)
+        return ports
+
+    def create_network(self, network_id):
+        if network_id in self.networks:
+            raise NetworkAlreadyExist(network_id=network_id)
+        self.networks[network_id] = set()
+        self._changed('networks')
+
+    def update_network(self, network_id):
+        if network_id not in self.networks:
+            self.networks[network_id] = set()
+            self._changed('networks')
+
+    def remove_network(self, network_id):
+        for dpid, port in list(self._ports(network_id)):
+            self._remove_port(network_id, dpid, port)
+        del self.networks[network_id]
+        self._changed('networks', ('ports', network_id))
+
+    def list_networks(self):
+        return list(self.networks)
+
+    def networks_json(self):
+        return self._cached('networks', self.list_networks)
+
+    def _add_port(self, network_id, dpid, port):
+        key = (dpid, port)
+        self.networks[network_id].add(key)
+        self.ports[key] = network_id
+        self.by_dpid.setdefault(dpid, set()).add(port)
+        self._changed(('ports', network_id))
+
+    def _remove_port(self, network_id, dpid, port):
+        key = (dpid, port)
+        self.networks[network_id].discard(key)
+        del self.ports[key]
+        ports = self.by_dpid[dpid]
+        ports.discard(port)
+        if not ports:
+            del self.by_dpid[dpid]
+        for mac in self.macs.pop(key, ()):
+            self._unindex_mac(mac, key)
+        self._changed(('ports', network_id), ('macs', key))
+
+    def create_port(self, network_id, dpid, port):
+        self.create_ports(network_id, [(dpid, port)])
+
+    def create_ports(self, network_id, ports):
+        # all or nothing: every port is checked before any is added
+        self._ports(network_id)
+        ports = list(ports)
+        if len(set(ports)) != len(ports):
+            dpid, port = [key for key in ports if ports.count(key) > 1][0]
+            raise PortAlreadyExist(network_id=network_id, dpid=dpid,
+                                   port=port)
+        for dpid, port in ports:
+            if (dpid, port) in self.ports:
+                raise PortAlreadyExist(network_id=network_id, dpid=dpid,
+                                       port=port)
+        for dpid, port in ports:
+            self._add_port(network_id, dpid, port)
+
+    def update_port(self, network_id, dpid, port):
+        # attach the port to network_id, moving it from any other network
+        self._ports(network_id)
+        old = self.ports.get((dpid, port))
+        if old == network_id:
+            return
+        if old is not None:
+            self._remove_port(old, dpid, port)
+        self._add_port(network_id, dpid, port)
+
+    def remove_port(self, network_id, dpid, port):
+        self.remove_ports(network_id, [(dpid, port)])
+
+    def remove_ports(self, network_id, ports):
+        self._ports(network_id)
+        ports = list(ports)
+        for dpid, port in ports:
+            if self.ports.get((dpid, port)) != network_id:
+                raise PortNotFound(network_id=network_id, dpid=dpid,
+                                   port=port)
+        for dpid, port in set(ports):
+            self._remove_port(network_id, dpid, port)
+
+    def list_ports(self, network_id):
+        return sorted(self._ports(network_id))
+
+    def ports_json(self, network_id):
+        return self._cached(('ports', network_id),
+                            lambda: self.list_ports(network_id))
+
+    def ports_on_dpid(self, dpid):
+        return [(self.ports[(dpid, port)], port)
+                for port in sorted(self.by_dpid.get(dpid, ()))]
+
+    def _unindex_mac(self, mac, key):
+        ports = self.by_mac[mac]
+        ports.discard(key)
+        if not ports:
+            del self.by_mac[mac]
+
+    def _port_macs(self, network_id, dpid, port):
+        key = (dpid, port)
+        if key not in self.ports or \
+                network_id is not None and self.ports[key] != network_id:
+            raise PortNotFound(network_id=network_id, dpid=dpid, port=port)
+        return key
+
+    def create_mac(self, network_id, dpid, port, mac):
+        self.create_macs(network_id, dpid, port, [mac])
+
+    def create_macs(self, network_id, dpid, port, macs):
+        key = self._port_macs(network_id, dpid, port)
+        macs = [normalize_mac(mac) for mac in macs]
+        existing = self.macs.get(key, ())
+        seen = set()
+        for mac in macs:
+            if mac in existing or mac in seen:
+                raise MacAddressAlreadyExist(dpid=dpid, port=port,
+                                             mac_address=mac)
+            seen.add(mac)
+        self.macs.setdefault(key, set()).update(seen)
+        for mac in seen:
+            self.by_mac.setdefault(mac, set()).add(key)
+        self._changed(('macs', key))
+
+    def update_mac(self, network_id, dpid, port, mac):
+        key = self._port_macs(network_id, dpid, port)
+        mac = normalize_mac(mac)
+        self.macs.setdefault(key, set()).add(mac)
+        self.by_mac.setdefault(mac, set()).add(key)
+        self._changed(('macs', key))
+
+    def remove_mac(self, network_id, dpid, port, mac):
+        key = self._port_macs(network_id, dpid, port)
+        mac = normalize_mac(mac)
+        macs = self.macs.get(key, ())
+        if mac not in macs:
+            raise PortNotFound(network_id=network_id, dpid=dpid, port=port)
+        macs.discard(mac)
+        if not macs:
+            del self.macs[key]
+        self._unindex_mac(mac, key)
+        self._changed(('macs', key))
+
+    def list_mac(self, dpid, port):
+        key = self._port_macs(None, dpid, port)
+        return sorted(self.macs.get(key, ()))
+
+    def macs_json(self, dpid, port):
+        return self._cached(('macs', (dpid, port)),
+                            lambda: self.list_mac(dpid, port))
+
+    def find_mac(self, mac):
+        # [(network_id, dpid, port)] the MAC is registered on
+        return [(self.ports[key],) + key
+                for key in sorted(self.by_mac.get(normalize_mac(mac), ()))]
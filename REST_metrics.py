@@ -0,0 +1,59 @@
+# ospf_switch with handler latency histograms and counters served as
+# Prometheus text on /metrics; run this app instead of OSPF_switch_v2
+from ryu.app import OSPF_metrics
+from ryu.app import OSPF_switch_v2
+from webob import Response
+from ryu.app.wsgi import ControllerBase, WSGIApplication, route
+
+metrics_name = 'ospf_metrics'
+
+
+class REST_metrics(OSPF_switch_v2.ospf_switch):
+    _CONTEXTS = {'wsgi': WSGIApplication}
+
+    def __init__(self, *args, **kwargs):
+        super(REST_metrics, self).__init__(*args, **kwargs)
+        self.metrics = OSPF_metrics.registry()
+        kwargs['wsgi'].register(metrics_controller, {metrics_name: self})
+
+    def metrics_text(self):
+        def per_dpid(counts):
+            return [({'dpid': '%016x' % dpid}, n)
+                    for dpid, n in sorted(counts.items())]
+        routes = self.routes
+        lookups = routes.hits + routes.misses
+        samples = [
+            ('ospf_flow_mods_total', 'counter',
+             per_dpid(self.flows.flow_mods)),
+            ('ospf_flow_mods_suppressed_total', 'counter',
+             per_dpid(self.flows.suppressed)),
+            ('ospf_flows_removed_total', 'counter',
+             per_dpid(self.flows.removed)),
+            ('ospf_flow_mods_rejected_total', 'counter',
+             per_dpid(self.flows.rejected)),
+            ('ospf_packet_in_dropped_total', 'counter',
+             [({'reason': reason}, n)
+              for reason, n in sorted(self.guard.dropped.items())]),
+            ('ospf_route_cache_hits_total', 'counter', [({}, routes.hits)]),
+            ('ospf_route_cache_misses_total', 'counter',
+             [({}, routes.misses)]),
+            ('ospf_route_cache_hit_ratio', 'gauge',
+             [({}, float(routes.hits) / lookups if lookups else 0.0)]),
+            ('ospf_spf_runs_total', 'counter', [({}, routes.spf_runs)]),
+            ('ospf_spf_seconds_total', 'counter', [({}, routes.spf_time)]),
+            ('ospf_switches', 'gauge', [({}, len(self.datapaths))]),
+            ('ospf_hosts', 'gauge', [({}, len(self.hosts))]),
+        ]
+        return self.metrics.render(samples)
+
+
+class metrics_controller(ControllerBase):
+    def __init__(self, req, link, data, **config):
+        super(metrics_controller, self).__init__(req, link, data, **config)
+        self.app = data[metrics_name]
+
+    @route('metrics', '/metrics', methods=['GET'])
+    def metrics(self, req, **kwargs):
+        body = self.app.metrics_text()
+        return Response(content_type='text/plain; version=0.0.4',
+                        charset='utf-8', body=body.encode('utf-8'))
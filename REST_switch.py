@@ -2,6 +2,8 @@
 # simple switch application with REST api
 import json
 import logging
+import re
+import time
 from ryu.app import OSPF_switch
 from webob import Response
 from ryu.controller import ofp_event
@@ -12,17 +14,23 @@ from ryu.lib import dpid as dpid_lib
 
 
 simple_name = 'simple_app'
-url = '/v1/simpleswitch/mactable/[dpid]'
+url = '/v1/simpleswitch/mactable/{dpid}'
+MAC_PATTERN = re.compile(r'^([0-9a-f]{2}:){5}[0-9a-f]{2}$')
 
 class REST_switch(OSPF_switch.ospf_switch):
 
     _CONTEXTS = { 'wsgi': WSGIApplication}
+    # above the learnt in_port+eth_dst entries, so the two never overlap
+    # at one priority and a configured entry wins
+    MAC_ENTRY_PRIORITY = 2
 
     def __init__(self, *args, **kwargs):
         super(REST_switch, self).__init__(*args, **kwargs)
         self.switches = {}
+        self.mac_cache = {}
+        self.mac_epoch = int(time.time())
         wsgi = kwargs['wsgi']
-        wsgi.register(REST_switch, {simple_name:self})
+        wsgi.register(REST_controller, {simple_name:self})
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
     def switch_features_handler(self, ev):
@@ -32,32 +40,84 @@ class REST_switch(OSPF_switch.ospf_switch):
         self.mac_to_port.setdefault(datapath.id, {})
 
     def set_mac_to_port(self, dpid, entry):
+        return self.set_mac_entries(dpid, [(entry['mac'], entry['port'])])
+
+    def set_mac_entries(self, dpid, entries):
+        # program a batch of (mac, port) entries with one flush; each
+        # entry is a single eth_dst flow, whatever the size of the table
         mac_table = self.mac_to_port.setdefault(dpid, {})
         datapath = self.switches.get(dpid)
 
-        entry_port = entry['port']
-        entry_mac = entry['mac']
-
         if datapath is not None:
             parser = datapath.ofproto_parser
-            if entry_port not in mac_table.values():
-                for mac, port in mac_table.items():
-                    actions = [parser.OFPActionOutput(entry_port)]
-                    match = parser.OFPMatch(in_port=port, eth_dst=entry_mac)
-                    self.add_flow(datapath, 1, match, actions)
+            for entry_mac, entry_port in entries:
+                actions = [parser.OFPActionOutput(entry_port)]
+                match = parser.OFPMatch(eth_dst=entry_mac)
+                self.add_flow(datapath, self.MAC_ENTRY_PRIORITY, match,
+                              actions)
+                self.learn_mac(dpid, entry_mac, entry_port)
+            self.flows.flush(datapath)
+        return mac_table
 
-                    actions = [parser.OFPActionOutput(port)]
-                    match = parser.OFPMatch(in_port=entry_port, eth_dst=mac)
-                    self.add_flow(datapath, 1, match, actions)
+    def mac_table_fragments(self, dpid):
+        # (etag, ['"mac": port', ...] sorted by mac), rebuilt only when the
+        # table's version has moved on
+        version = self.mac_version.get(dpid, 0)
+        cached = self.mac_cache.get(dpid)
+        if cached is None or cached[0] != version:
+            fragments = ['%s: %d' % (json.dumps(mac), port) for mac, port
+                         in sorted(self.mac_to_port.get(dpid, {}).items())]
+            etag = '%x-%x-%d' % (self.mac_epoch, dpid, version)
+            cached = self.mac_cache[dpid] = (version, etag, fragments)
+        return cached[1], cached[2]
+
+
+def parse_entries(body):
+    # a single {"mac": ..., "port": ...} object or a list of them
+    entries = json.loads(body)
+    if isinstance(entries, dict):
+        entries = [entries]
+    if not isinstance(entries, list):
+        raise ValueError('expected an entry or a list of entries')
+    parsed = []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            raise ValueError('entry is not an object: %r' % (entry,))
+        mac = entry.get('mac')
+        port = entry.get('port')
+        if not isinstance(mac, str) or not MAC_PATTERN.match(mac.lower()):
+            raise ValueError('bad mac: %r' % (mac,))
+        if not isinstance(port, int) or isinstance(port, bool) or \
+                not 0 < port <= 0xffffff00:
+            raise ValueError('bad port: %r' % (port,))
+        parsed.append((mac.lower(), port))
+    return parsed
 
-                mac_table.updates({entry_mac : entry_port})
-        return mac_table
 
 class REST_controller(ControllerBase):
     def __init__(self, req, link, data, **config):
         super(REST_controller, self).__init__(req, link, data, **config)
         self.simple_switch_spp = data[simple_name]
 
+    def mac_table_response(self, req, dpid):
+        simple_switch = self.simple_switch_spp
+        etag, fragments = simple_switch.mac_table_fragments(dpid)
+        if etag in req.if_none_match:
+            return Response(status=304, etag=etag)
+        try:
+            offset = int(req.GET.get('offset', 0))
+            limit = req.GET.get('limit')
+            limit = len(fragments) if limit is None else int(limit)
+        except ValueError:
+            return Response(status=400)
+        if offset < 0 or limit < 0:
+            return Response(status=400)
+        body = '{' + ', '.join(fragments[offset:offset + limit]) + '}'
+        res = Response(content_type='application/json',
+                       body=body.encode('utf-8'), etag=etag)
+        res.headers['X-Total-Count'] = str(len(fragments))
+        return res
+
     @route('simpleswitch', url, methods=['GET'], requirements={'dpid': dpid_lib.DPID_PATTERN})
     def list_mac_table(self, req, **kwargs):
         simple_switch = self.simple_switch_spp
@@ -65,22 +125,22 @@ class REST_controller(ControllerBase):
 
         if dpid not in simple_switch.mac_to_port:
             return Response(status=404)
-        mac_table = simple_switch.mac_to_port.get(dpid, {})
-        body = json.dumps(mac_table)
-        return Response(content_type='application/json', body=body)
+        return self.mac_table_response(req, dpid)
 
     @route('simpleswitch', url, methods=['PUT'], requirements={'dpid': dpid_lib.DPID_PATTERN})
     def put_mac_table(self, req, **kwargs):
         simple_switch = self.simple_switch_spp
         dpid = dpid_lib.str_to_dpid(kwargs['dpid'])
-        new_entry = eval(req.body)
 
         if dpid not in simple_switch.mac_to_port:
             return Response(status=404)
+        try:
+            entries = parse_entries(req.body)
+        except ValueError as e:
+            return Response(status=400, body=str(e).encode('utf-8'))
 
         try:
-            mac_table = simple_switch.mac_to_port.get(dpid, new_entry)
-            body = json.dumps(mac_table)
-            return Response(content_type='application/json', body=body)
+            simple_switch.set_mac_entries(dpid, entries)
+            return self.mac_table_response(req, dpid)
         except Exception as e:
             return Response(status=500)
@@ -3,8 +3,8 @@
 
 import json
 from webob import Response
-import OSPF_switch
 from ryu.topology import switches
+from ryu.app import OSPF_tenants
 from ryu.app import wsgi as wsgi_app
 from ryu.base import app_manager
 from ryu.app.wsgi import ControllerBase, WSGIApplication
@@ -12,10 +12,24 @@ from ryu.controller import network
 from ryu.exception import NetworkNotFound, NetworkAlreadyExist
 from ryu.exception import PortNotFound, PortAlreadyExist
 from ryu.lib import dpid as dpid_lib
-from ryu.lib import mac as mac_lib
 
 
-class Rest_controller(OSPF_switch.ospf_switch):
+def json_response(body):
+    return Response(content_type='application/json', body=body)
+
+
+def parse_ports(body):
+    # [{"dpid": <hex string or int>, "port": <int>}, ...]
+    ports = []
+    for entry in json.loads(body):
+        dpid = entry['dpid']
+        if not isinstance(dpid, int):
+            dpid = dpid_lib.str_to_dpid(dpid)
+        ports.append((dpid, int(entry['port'])))
+    return ports
+
+
+class Rest_controller(ControllerBase):
     def __init__(self, req, link, data, **config):
         super(Rest_controller, self).__init__(req, link, data, **config)
         self.nw = data
@@ -33,8 +47,7 @@ class Rest_controller(OSPF_switch.ospf_switch):
         return Response(status=200)
 
     def lists(self, req, **_kwargs):
-        body = json.dumps(self.nw.list_networks())
-        return Response(content_type='application/json', body=body)
+        return json_response(self.nw.networks_json())
 
     def delete(self, req, network_id, **_kwargs):
         try:
@@ -44,7 +57,7 @@ class Rest_controller(OSPF_switch.ospf_switch):
         return Response(status=200)
 
 
-class Rest_ports(OSPF_switch.ospf_switch):
+class Rest_ports(ControllerBase):
     def __init__(self, req, link, data, **config):
         super(Rest_ports, self).__init__(req, link, data, **config)
         self.nw = data
@@ -61,6 +74,19 @@ class Rest_ports(OSPF_switch.ospf_switch):
 
         return Response(status=200)
 
+    def bulk_create(self, req, network_id, **_kwargs):
+        try:
+            ports = parse_ports(req.body)
+        except (ValueError, KeyError, TypeError):
+            return Response(status=400)
+        try:
+            self.nw.create_ports(network_id, ports)
+        except NetworkNotFound:
+            return Response(status=404)
+        except PortAlreadyExist:
+            return Response(status=409)
+        return Response(status=200)
+
     def update(self, req, network_id, dpid, port_id, **_kwargs):
         dpid = dpid_lib.str_to_dpid(dpid)
         port_id = int(port_id)
@@ -72,11 +98,11 @@ class Rest_ports(OSPF_switch.ospf_switch):
 
     def lists(self, req, network_id, **_kwargs):
         try:
-            body = json.dumps(self.nw.list_ports(network_id))
+            body = self.nw.ports_json(network_id)
         except NetworkNotFound:
             return Response(status=404)
 
-        return Response(content_type='application/json', body=body)
+        return json_response(body)
 
     def delete(self, req, network_id, dpid, port_id, **_kwargs):
         dpid = dpid_lib.str_to_dpid(dpid)
@@ -88,8 +114,19 @@ class Rest_ports(OSPF_switch.ospf_switch):
 
         return Response(status=200)
 
+    def bulk_delete(self, req, network_id, **_kwargs):
+        try:
+            ports = parse_ports(req.body)
+        except (ValueError, KeyError, TypeError):
+            return Response(status=400)
+        try:
+            self.nw.remove_ports(network_id, ports)
+        except (NetworkNotFound, PortNotFound):
+            return Response(status=404)
+        return Response(status=200)
+
 
-class Rest_mac(OSPF_switch.ospf_switch):
+class Rest_mac(ControllerBase):
     def __init__(self, req, link, data, **config):
         super(Rest_mac, self).__init__(req, link, data, **config)
         self.nw = data
@@ -97,9 +134,26 @@ class Rest_mac(OSPF_switch.ospf_switch):
     def create(self, _req, network_id, dpid, port_id, mac_addr, **_kwargs):
         dpid = dpid_lib.str_to_dpid(dpid)
         port_id = int(port_id)
-        mac_addr = mac_lib.haddr_to_bin(mac_addr)
         try:
             self.nw.create_mac(network_id, dpid, port_id, mac_addr)
+        except ValueError:
+            return Response(status=400)
+        except PortNotFound:
+            return Response(status=404)
+        except network.MacAddressAlreadyExist:
+            return Response(status=409)
+        return Response(status=200)
+
+    def bulk_create(self, req, network_id, dpid, port_id, **_kwargs):
+        dpid = dpid_lib.str_to_dpid(dpid)
+        port_id = int(port_id)
+        try:
+            macs = json.loads(req.body)
+            if not isinstance(macs, list):
+                raise ValueError('expected a list of macs')
+            self.nw.create_macs(network_id, dpid, port_id, macs)
+        except (ValueError, AttributeError):
+            return Response(status=400)
         except PortNotFound:
             return Response(status=404)
         except network.MacAddressAlreadyExist:
@@ -109,9 +163,21 @@ class Rest_mac(OSPF_switch.ospf_switch):
     def update(self, _req, network_id, dpid, port_id, mac_addr, **_kwargs):
         dpid = dpid_lib.str_to_dpid(dpid)
         port_id = int(port_id)
-        mac_addr = mac_lib.haddr_to_bin(mac_addr)
         try:
             self.nw.update_mac(network_id, dpid, port_id, mac_addr)
+        except ValueError:
+            return Response(status=400)
+        except PortNotFound:
+            return Response(status=404)
+        return Response(status=200)
+
+    def delete(self, _req, network_id, dpid, port_id, mac_addr, **_kwargs):
+        dpid = dpid_lib.str_to_dpid(dpid)
+        port_id = int(port_id)
+        try:
+            self.nw.remove_mac(network_id, dpid, port_id, mac_addr)
+        except ValueError:
+            return Response(status=400)
         except PortNotFound:
             return Response(status=404)
         return Response(status=200)
@@ -120,22 +186,42 @@ class Rest_mac(OSPF_switch.ospf_switch):
         dpid = dpid_lib.str_to_dpid(dpid)
         port_id = int(port_id)
         try:
-            body = json.dumps([mac_lib.haddr_to_str(mac_addr) for mac_addr in
-                               self.nw.list_mac(dpid, port_id)])
+            body = self.nw.macs_json(dpid, port_id)
         except PortNotFound:
             return Response(status=404)
-        return Response(content_type='application/json', body=body)
+        return json_response(body)
+
+
+class Rest_lookup(ControllerBase):
+    def __init__(self, req, link, data, **config):
+        super(Rest_lookup, self).__init__(req, link, data, **config)
+        self.nw = data
+
+    def mac(self, _req, mac_addr, **_kwargs):
+        # [[network_id, dpid, port], ...] the MAC is registered on
+        try:
+            found = self.nw.find_mac(mac_addr)
+        except ValueError:
+            return Response(status=400)
+        if not found:
+            return Response(status=404)
+        return json_response(json.dumps(found).encode('utf-8'))
+
+    def ports(self, _req, dpid, **_kwargs):
+        # [[network_id, port], ...] for the switch's registered ports
+        dpid = dpid_lib.str_to_dpid(dpid)
+        body = json.dumps(self.nw.ports_on_dpid(dpid))
+        return json_response(body.encode('utf-8'))
 
 
 class RestAPI(app_manager.RyuApp):
     _CONTEXTS = {
-        'network': network.Network,
         'wsgi': WSGIApplication
     }
 
     def __init__(self, *args, **kwargs):
         super(RestAPI, self).__init__(*args, **kwargs)
-        self.nw = kwargs['network']
+        self.nw = OSPF_tenants.tenant_registry()
         wsgi = kwargs['wsgi']
         mapper = wsgi.mapper
 
@@ -143,7 +229,7 @@ class RestAPI(app_manager.RyuApp):
         route_name = 'networks'
         uri = '/v1.3/networks'
         mapper.connect(route_name, uri,
-                       controller=Rest_controller, action='list',
+                       controller=Rest_controller, action='lists',
                        conditions=dict(method=['GET', 'HEAD']))
         uri += '/{network_id}'
         s = mapper.submapper(controller=Rest_controller)
@@ -152,13 +238,18 @@ class RestAPI(app_manager.RyuApp):
         s.connect(route_name, uri, action='update',
                   conditions=dict(method=['PUT']))
         s.connect(route_name, uri, action='delete',
-                  condition=dict(method=['DELETE']))
+                  conditions=dict(method=['DELETE']))
 
         wsgi.registory['Rest_ports'] = self.nw
         route_name = 'ports'
         mapper.connect(route_name, uri,
                        controller=Rest_ports, action='lists',
                        conditions=dict(method=['GET']))
+        s = mapper.submapper(controller=Rest_ports)
+        s.connect(route_name, uri + '/ports', action='bulk_create',
+                  conditions=dict(method=['POST']))
+        s.connect(route_name, uri + '/ports', action='bulk_delete',
+                  conditions=dict(method=['DELETE']))
         uri += '/{dpid}_{port_id}'
         requirements = {'dpid': dpid_lib.DPID_PATTERN,
                         'port_id': wsgi_app.DIGIT_PATTERN}
@@ -169,13 +260,27 @@ class RestAPI(app_manager.RyuApp):
                   conditions=dict(method=['PUT']))
         s.connect(route_name, uri, action='delete',
                   conditions=dict(method=['DELETE']))
+
         wsgi.registory['Rest_mac'] = self.nw
         route_name = 'macs'
         uri += '/macs'
-        mapper.connect(route_name, uri,
-                       controller=Rest_mac,
-                       requirements=requirements)
+        s = mapper.submapper(controller=Rest_mac, requirements=requirements)
+        s.connect(route_name, uri, action='lists',
+                  conditions=dict(method=['GET']))
+        s.connect(route_name, uri, action='bulk_create',
+                  conditions=dict(method=['POST']))
+        uri += '/{mac_addr}'
         s.connect(route_name, uri, action='create',
                   conditions=dict(method=['POST']))
         s.connect(route_name, uri, action='update',
                   conditions=dict(method=['PUT']))
+        s.connect(route_name, uri, action='delete',
+                  conditions=dict(method=['DELETE']))
+
+        wsgi.registory['Rest_lookup'] = self.nw
+        s = mapper.submapper(controller=Rest_lookup)
+        s.connect('lookup', '/v1.3/macs/{mac_addr}', action='mac',
+                  conditions=dict(method=['GET']))
+        s.connect('lookup', '/v1.3/switches/{dpid}/ports', action='ports',
+                  requirements={'dpid': dpid_lib.DPID_PATTERN},
+                  conditions=dict(method=['GET']))
@@ -0,0 +1,103 @@
+import random
+
+import networkx as nx
+import pytest
+
+import OSPF_guard
+
+
+def check_tree(flood, links):
+    # the tree spans every component of the links up, and nothing more
+    net = nx.Graph()
+    net.add_nodes_from(flood.component)
+    net.add_edges_from((u, v) for u, v in links)
+    tree = nx.Graph()
+    tree.add_nodes_from(flood.component)
+    for u, neighbours in flood.tree.items():
+        for v in neighbours:
+            assert u in flood.tree[v]
+            assert net.has_edge(u, v)
+            tree.add_edge(u, v)
+    assert nx.is_forest(tree)
+    want = sorted(sorted(c) for c in nx.connected_components(net))
+    assert sorted(sorted(c) for c in nx.connected_components(tree)) == want
+    members = sorted(sorted(m) for m in flood.members.values())
+    assert members == want
+    for cid, nodes in flood.members.items():
+        for n in nodes:
+            assert flood.component[n] == cid
+
+
+@pytest.mark.parametrize('seed', range(300))
+def test_flood_tree_matches_components(seed):
+    rnd = random.Random(seed)
+    nodes = list(range(1, rnd.randint(3, 25)))
+    flood = OSPF_guard.flood_tree()
+    directed = set()
+
+    def up():
+        return set(tuple(sorted(link)) for link in directed)
+
+    for _ in range(60):
+        before = dict((n, set(v)) for n, v in flood.tree.items())
+        changed = set()
+        op = rnd.random()
+        if op < 0.5:
+            u, v = rnd.sample(nodes, 2)
+            for link in ((u, v), (v, u)):
+                directed.add(link)
+                changed |= flood.add_link(*link)
+        elif op < 0.9 and directed:
+            # usually both directions go; sometimes only one, and the
+            # link stays up
+            u, v = rnd.choice(sorted(directed))
+            changed |= flood.remove_link(u, v)
+            directed.discard((u, v))
+            if rnd.random() < 0.8:
+                changed |= flood.remove_link(v, u)
+                directed.discard((v, u))
+        else:
+            n = rnd.choice(nodes)
+            changed |= flood.remove_node(n)
+            directed = set(link for link in directed if n not in link)
+            flood.add_node(n)
+            before.pop(n, None)
+        check_tree(flood, up())
+        for n, neighbours in flood.tree.items():
+            if n in before and neighbours != before[n]:
+                assert n in changed
+
+
+def test_token_bucket():
+    bucket = OSPF_guard.token_bucket(10, 20, 0.0)
+    assert all(bucket.take(0.0) for _ in range(20))
+    assert not bucket.take(0.0)
+    assert bucket.take(0.1)
+    assert not bucket.take(0.1)
+    # refills up to the burst and no further
+    assert sum(bucket.take(100.0) for _ in range(30)) == 20
+
+
+def test_guard_drops_duplicates_within_window():
+    guard = OSPF_guard.packet_in_guard(1000, 1000, 0.5)
+    assert guard.admit(1, 1, b'frame', now=0.0)
+    assert not guard.admit(1, 2, b'frame', now=0.1)
+    # the same frame on another switch is another packet-in
+    assert guard.admit(2, 1, b'frame', now=0.1)
+    assert guard.admit(1, 1, b'other', now=0.1)
+    assert guard.admit(1, 1, b'frame', now=0.6)
+    assert guard.dropped['duplicate'] == 1
+
+
+def test_guard_rate_limits_port_then_datapath():
+    guard = OSPF_guard.packet_in_guard(30, 10, 0)
+    admitted = sum(guard.admit(1, 1, b'%d' % i, now=0.0) for i in range(50))
+    assert admitted == 20
+    assert guard.dropped['port'] == 30
+    for port in (2, 3, 4):
+        for i in range(20):
+            guard.admit(1, port, b'%d-%d' % (port, i), now=0.0)
+    # the datapath bucket holds twice its rate, 60 packet-ins
+    assert guard.dropped['datapath'] == 20
+    guard.forget(1)
+    assert guard.admit(1, 1, b'again', now=0.0)
@@ -0,0 +1,235 @@
+import random
+
+import networkx as nx
+import pytest
+
+import OSPF_spf
+
+
+def random_net(rnd, nodes, links):
+    # links both ways, as the topology events report them, with a port
+    # per neighbour and a random cost each way
+    net = nx.DiGraph()
+    net.add_nodes_from(range(1, nodes + 1))
+    while net.number_of_edges() < 2 * links:
+        u, v = rnd.sample(range(1, nodes + 1), 2)
+        if not net.has_edge(u, v):
+            net.add_edge(u, v, port=v, cost=rnd.randint(1, 10))
+            net.add_edge(v, u, port=u, cost=rnd.randint(1, 10))
+    return net
+
+
+def expected(net, dst):
+    return nx.single_source_dijkstra_path_length(net.reverse(copy=False),
+                                                 dst, weight='cost')
+
+
+def check(routes):
+    net = routes.net
+    for dst in net:
+        want = expected(net, dst)
+        assert routes.distances(dst) == want
+        for node in net:
+            next = routes.lookup(node, dst)
+            if node == dst or node not in want:
+                assert next is None
+            else:
+                assert want[next] + net[node][next]['cost'] == want[node]
+
+
+def warm(routes):
+    for dst in list(routes.net):
+        routes.distances(dst)
+
+
+def random_change(rnd, routes):
+    net = routes.net
+    edges = list(net.edges())
+    op = rnd.choice(('add', 'remove', 'cost', 'cost', 'node'))
+    if op == 'add' or not edges:
+        u, v = rnd.sample(list(net), 2)
+        routes.add_link(u, v, port=v, cost=rnd.randint(1, 10))
+    elif op == 'remove':
+        routes.remove_link(*rnd.choice(edges))
+    elif op == 'cost':
+        u, v = rnd.choice(edges)
+        routes.set_cost(u, v, rnd.randint(1, 10))
+    elif len(net) > 3:
+        routes.remove_node(rnd.choice(list(net)))
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_incremental_matches_dijkstra(seed):
+    rnd = random.Random(seed)
+    routes = OSPF_spf.route_cache(random_net(rnd, 20, 30))
+    warm(routes)
+    check(routes)
+    for _ in range(40):
+        random_change(rnd, routes)
+        check(routes)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_changes_cover_moved_distances(seed):
+    rnd = random.Random(seed)
+    routes = OSPF_spf.route_cache(random_net(rnd, 15, 20))
+    warm(routes)
+    routes.changes()
+    for _ in range(30):
+        before = dict((dst, dict(routes.dist[dst])) for dst in routes.dist)
+        links = dict((u, dict(routes.net.succ[u])) for u in routes.net)
+        random_change(rnd, routes)
+        moved, relinked = routes.changes()
+        for dst in routes.net:
+            if dst in before and routes.distances(dst) != before[dst]:
+                assert dst in moved
+        for u in routes.net:
+            if dict(routes.net.succ[u]) != links[u]:
+                assert u in relinked
+        warm(routes)
+
+
+def test_unreachable_and_unknown():
+    net = nx.DiGraph()
+    net.add_edge(1, 2, port=2)
+    net.add_edge(2, 1, port=1)
+    net.add_node(3)
+    routes = OSPF_spf.route_cache(net)
+    assert routes.lookup(1, 2) == 2
+    assert routes.lookup(1, 3) is None
+    assert routes.lookup(1, 4) is None
+    assert routes.distances(4) == {}
+    routes.remove_link(1, 2)
+    assert routes.lookup(1, 2) is None
+    routes.add_link(1, 3, port=3, cost=2)
+    routes.add_link(3, 2, port=2, cost=2)
+    assert routes.lookup(1, 2) == 3
+    assert routes.distances(2)[1] == 4
+
+
+def test_clear_reports_everything():
+    rnd = random.Random(0)
+    routes = OSPF_spf.route_cache(random_net(rnd, 5, 6))
+    warm(routes)
+    routes.clear()
+    assert routes.changes() is None
+    assert routes.changes() == (set(), set())
+
+
+def test_lfa_is_loop_free():
+    rnd = random.Random(1)
+    routes = OSPF_spf.route_cache(random_net(rnd, 20, 40))
+    for dst in routes.net:
+        for node in routes.net:
+            alt = routes.lfa(node, dst)
+            if alt is None:
+                continue
+            assert alt != routes.lookup(node, dst)
+            # the alternate's own route must not lead back through node
+            hop = alt
+            while hop != dst:
+                assert hop != node
+                hop = routes.lookup(hop, dst)
+
+
+def test_forwarding_ports_reach_host():
+    rnd = random.Random(2)
+    routes = OSPF_spf.route_cache(random_net(rnd, 12, 20))
+    for ecmp in (False, True):
+        for src in routes.net:
+            for dst in routes.net:
+                if src == dst:
+                    continue
+                hops = OSPF_spf.forwarding_ports(routes, src, dst, 99, ecmp)
+                if not hops:
+                    assert src not in expected(routes.net, dst)
+                    continue
+                assert hops[0][0] == src
+                assert (dst, (99,)) in hops
+
+
+def area_net(rnd, areas, size, inter):
+    # each area a ring with random chords, joined by random inter-area
+    # links both ways
+    net = nx.DiGraph()
+    area_of = {}
+
+    def link(u, v):
+        net.add_edge(u, v, port=v, cost=rnd.randint(1, 10))
+        net.add_edge(v, u, port=u, cost=rnd.randint(1, 10))
+
+    for area in range(areas):
+        nodes = [area * size + i + 1 for i in range(size)]
+        for i, node in enumerate(nodes):
+            area_of[node] = area
+            link(node, nodes[(i + 1) % size])
+        for _ in range(size // 2):
+            link(*rnd.sample(nodes, 2))
+    for _ in range(inter):
+        u, v = rnd.sample(list(net), 2)
+        if area_of[u] != area_of[v]:
+            link(u, v)
+    return net, area_of
+
+
+def route_of(routes, node, dst):
+    path = [node]
+    while node != dst:
+        node = routes.lookup(node, dst)
+        if node is None:
+            return None
+        assert node not in path, 'loop toward %s: %s' % (dst, path)
+        path.append(node)
+    return path
+
+
+def check_areas(routes, area_of):
+    net = routes.net
+    for dst in net:
+        area = area_of[dst]
+        inside = expected(net.subgraph(n for n in net
+                                       if area_of[n] == area), dst)
+        # a switch that reaches dst inside its area takes that route, as
+        # in OSPF, so its links out of the area are not on any route
+        allowed = net.copy()
+        allowed.remove_edges_from([(u, v) for u, v in net.edges()
+                                   if u in inside and area_of[v] != area])
+        want = expected(allowed, dst)
+        reachable = expected(net, dst)
+        for node in net:
+            if node == dst:
+                continue
+            path = route_of(routes, node, dst)
+            assert (path is not None) == (node in reachable)
+            if path is None:
+                continue
+            cost = sum(net[u][v]['cost'] for u, v in zip(path, path[1:]))
+            assert cost == routes.distance(node, dst) == want[node]
+            if node in inside:
+                assert cost == inside[node]
+            for v in routes.lookup_all(node, dst):
+                assert routes.distance(v, dst) + net[node][v]['cost'] == \
+                    cost
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_areas_loop_free_and_reachable(seed):
+    rnd = random.Random(seed)
+    net, area_of = area_net(rnd, 4, 6, 12)
+    routes = OSPF_spf.area_routes(net, area_of)
+    check_areas(routes, area_of)
+    for _ in range(15):
+        random_change(rnd, routes)
+        check_areas(routes, area_of)
+
+
+def test_single_area_matches_route_cache():
+    rnd = random.Random(3)
+    net = random_net(rnd, 15, 25)
+    routes = OSPF_spf.area_routes(net.copy())
+    flat = OSPF_spf.route_cache(net)
+    for dst in net:
+        for node in net:
+            assert routes.lookup(node, dst) == flat.lookup(node, dst)
+            assert routes.lfa(node, dst) == flat.lfa(node, dst)
+    assert routes.changes() is None
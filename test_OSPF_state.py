@@ -0,0 +1,158 @@
+import random
+import struct
+
+import networkx as nx
+import pytest
+
+import OSPF_hosts
+import OSPF_spf
+import OSPF_state
+
+
+def fabric(rnd, nodes=12, links=20):
+    net = nx.DiGraph()
+    while net.number_of_edges() < 2 * links:
+        u, v = rnd.sample(range(1, nodes + 1), 2)
+        net.add_edge(u, v, port=v, cost=rnd.randint(1, 10))
+        net.add_edge(v, u, port=u, cost=rnd.randint(1, 10))
+    return net
+
+
+def host_table(rnd, count=50):
+    hosts = OSPF_hosts.host_table()
+    for h in range(count):
+        hosts.learn_key(0x020000000000 + h, rnd.randint(1, 12),
+                        rnd.randint(1, 48), 0.0)
+    return hosts
+
+
+def saved(tmp_path, routes, hosts, **kwargs):
+    path = str(tmp_path / 'state')
+    OSPF_state.save(path, routes, hosts, **kwargs)
+    return path
+
+
+def test_round_trip_route_cache(tmp_path):
+    rnd = random.Random(0)
+    routes = OSPF_spf.route_cache(fabric(rnd))
+    for dst in list(routes.net):
+        routes.distances(dst)
+    hosts = host_table(rnd)
+    path = saved(tmp_path, routes, hosts)
+
+    loaded = OSPF_spf.route_cache(nx.DiGraph())
+    loaded_hosts = OSPF_hosts.host_table()
+    edges = OSPF_state.load(path, loaded, loaded_hosts, now=5.0)
+    assert sorted(edges) == sorted(routes.net.edges())
+    assert sorted(loaded.net.edges(data=True)) == \
+        sorted(routes.net.edges(data=True))
+    assert sorted(loaded_hosts.items()) == sorted(hosts.items())
+    # restored routes are served without running SPF again
+    loaded.spf_runs = 0
+    for dst in routes.net:
+        assert loaded.dist[dst] == routes.dist[dst]
+        for node in routes.net:
+            assert loaded.lookup(node, dst) == routes.lookup(node, dst)
+    assert loaded.spf_runs == 0
+
+
+def test_round_trip_area_routes(tmp_path):
+    rnd = random.Random(1)
+    net = fabric(rnd, 16, 30)
+    areas = dict((n, (n - 1) // 4) for n in net)
+    routes = OSPF_spf.area_routes(net, areas)
+    for dst in net:
+        for node in net:
+            routes.lookup(node, dst)
+    path = saved(tmp_path, routes, OSPF_hosts.host_table())
+
+    loaded = OSPF_spf.area_routes(nx.DiGraph(), areas)
+    OSPF_state.load(path, loaded, OSPF_hosts.host_table())
+    for dst in net:
+        for node in net:
+            assert loaded.lookup(node, dst) == routes.lookup(node, dst)
+            assert loaded.distance(node, dst) == routes.distance(node, dst)
+
+
+def test_save_in_slices(tmp_path, monkeypatch):
+    monkeypatch.setattr(OSPF_state, 'SLICE', 7)
+    rnd = random.Random(2)
+    routes = OSPF_spf.route_cache(fabric(rnd))
+    for dst in list(routes.net):
+        routes.distances(dst)
+    pauses = []
+    path = saved(tmp_path, routes, host_table(rnd),
+                 pause=lambda: pauses.append(1))
+    assert len(pauses) > 10
+    loaded = OSPF_spf.route_cache(nx.DiGraph())
+    OSPF_state.load(path, loaded, OSPF_hosts.host_table())
+    assert loaded.dist == routes.dist
+
+
+def test_routes_changed_during_save_are_left_out(tmp_path):
+    rnd = random.Random(3)
+    routes = OSPF_spf.route_cache(fabric(rnd))
+    for dst in list(routes.net):
+        routes.distances(dst)
+    u, v = next(iter(routes.net.edges()))
+
+    def pause():
+        if routes.net.has_edge(u, v):
+            routes.remove_link(u, v)
+    path = saved(tmp_path, routes, host_table(rnd), pause=pause)
+    loaded = OSPF_spf.route_cache(nx.DiGraph())
+    OSPF_state.load(path, loaded, OSPF_hosts.host_table())
+    assert loaded.dist == {}
+    assert not loaded.net.has_edge(u, v)
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / 'state'
+    path.write_bytes(b'')
+    with pytest.raises(ValueError):
+        OSPF_state.load(str(path), OSPF_spf.route_cache(nx.DiGraph()),
+                        OSPF_hosts.host_table())
+
+
+def test_bad_magic(tmp_path):
+    rnd = random.Random(4)
+    path = saved(tmp_path, OSPF_spf.route_cache(fabric(rnd)),
+                 host_table(rnd))
+    with open(path, 'r+b') as f:
+        f.write(b'XXXX')
+    with pytest.raises(ValueError):
+        OSPF_state.load(path, OSPF_spf.route_cache(nx.DiGraph()),
+                        OSPF_hosts.host_table())
+
+
+@pytest.mark.parametrize('keep', [
+    lambda data: data[:10],
+    lambda data: data[:-5],
+    lambda data: data[:-OSPF_state._ROUTE.size],
+], ids=['header', 'mid-record', 'record-boundary'])
+def test_truncated_file(tmp_path, keep):
+    rnd = random.Random(5)
+    routes = OSPF_spf.route_cache(fabric(rnd))
+    routes.distances(1)
+    path = saved(tmp_path, routes, host_table(rnd))
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(keep(data))
+    with pytest.raises(struct.error):
+        OSPF_state.load(path, OSPF_spf.route_cache(nx.DiGraph()),
+                        OSPF_hosts.host_table())
+
+
+def test_float_cost_is_refused(tmp_path):
+    rnd = random.Random(6)
+    routes = OSPF_spf.route_cache(fabric(rnd))
+    path = saved(tmp_path, routes, host_table(rnd))
+    u, v = next(iter(routes.net.edges()))
+    routes.net[u][v]['cost'] = 2.5
+    with pytest.raises(ValueError):
+        OSPF_state.save(path, routes, host_table(rnd))
+    # the last good file is left in place
+    loaded = OSPF_spf.route_cache(nx.DiGraph())
+    OSPF_state.load(path, loaded, OSPF_hosts.host_table())
+    assert loaded.net.number_of_edges() == routes.net.number_of_edges()